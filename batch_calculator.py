@@ -0,0 +1,157 @@
+import argparse
+import contextlib
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+import bracket_store
+import calculate_tax_data
+import microsimulation
+
+# Scores a file of incomes offline: every record's owed, effective and
+# marginal rate, streamed chunk by chunk so memory stays flat however long
+# the input is. Records need income, year and filer columns, and may name a
+# country. Reads and writes stdin/stdout by default, so it sits in a pipe:
+#   zcat incomes.csv.gz | python batch_calculator.py --to jsonl | ...
+# Progress and the final throughput go to stderr. Reading and grouping
+# records by schedule are shared with microsimulation.py.
+FORMATS = ("csv", "jsonl", "parquet", "arrow")
+EXTENSIONS = {".csv": "csv", ".jsonl": "jsonl", ".json": "jsonl",
+              ".parquet": "parquet", ".arrow": "arrow"}
+
+
+def infer_format(path, default="csv"):
+    if path is None or path == "-":
+        return default
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower(), default)
+
+
+def calculate_chunk(chunk: pd.DataFrame, schedules):
+    # (chunk with results, records without a valid income). Records without
+    # a valid income or a schedule get no results
+    chunk, incomes = microsimulation.prepare_chunk(chunk)
+    valid = np.isfinite(incomes)
+    owed = np.full(len(chunk), np.nan)
+    marginal_rate = np.full(len(chunk), np.nan)
+    for _, rows, schedule in microsimulation.group_records(chunk, valid, schedules):
+        owed[rows] = calculate_tax_data.calculate_tax_owed(incomes[rows], schedule)
+        index = calculate_tax_data.find_brackets(np.clip(incomes[rows], 0, None), schedule)
+        marginal_rate[rows] = schedule.bracket_rate[index]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        effective_rate = np.where(incomes > 0, owed / incomes, np.where(np.isnan(owed), np.nan, 0.0))
+    # Incomes are written as parsed, so every chunk has the same float column
+    # and invalid ones come out blank in every format
+    chunk = chunk.assign(income=incomes, owed=owed, effective_rate=effective_rate,
+                         marginal_rate=marginal_rate)
+    return chunk, int((~valid).sum())
+
+
+class ChunkWriter:
+    # Appends chunks to one output in the chosen format
+    def __init__(self, sink, output_format):
+        self.sink = sink
+        self.output_format = output_format
+        self.writer = None
+        self.schema = None
+
+    def write(self, chunk: pd.DataFrame):
+        if self.output_format == "csv":
+            chunk.to_csv(self.sink, header=self.writer is None, index=False)
+            self.writer = True
+        elif self.output_format == "jsonl":
+            chunk.to_json(self.sink, orient="records", lines=True)
+        else:
+            self.write_arrow(chunk)
+
+    def write_arrow(self, chunk):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError(f"Writing {self.output_format} requires pyarrow")
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if self.writer is None:
+            self.schema = table.schema
+            if self.output_format == "parquet":
+                self.writer = pq.ParquetWriter(self.sink, self.schema)
+            else:
+                self.writer = pa.ipc.new_stream(self.sink, self.schema)
+        # Later chunks can infer other types, e.g. a column that was all null
+        self.writer.write_table(table.cast(self.schema))
+
+    def close(self):
+        if self.output_format in ("parquet", "arrow") and self.writer is not None:
+            writer, self.writer = self.writer, None
+            writer.close()
+
+
+def run_batch(input_path=None, output_path=None, input_format=None, output_format=None,
+              chunk_size=microsimulation.CHUNK_SIZE):
+    # Returns (records, records without a schedule, records without a valid income)
+    input_format = input_format or infer_format(input_path)
+    output_format = output_format or infer_format(output_path)
+    binary_output = output_format in ("parquet", "arrow")
+    # Before the output is opened, so a missing store leaves no empty file
+    schedules = bracket_store.load_schedules()
+    if input_path is None or input_path == "-":
+        source = sys.stdin.buffer if input_format in ("parquet", "arrow") else sys.stdin
+    else:
+        source = input_path
+    if output_path is None or output_path == "-":
+        sink = sys.stdout.buffer if binary_output else sys.stdout
+    else:
+        sink = open(output_path, "wb") if binary_output else open(output_path, "w", newline="")
+    records = 0
+    unmatched = 0
+    invalid = 0
+    writer = ChunkWriter(sink, output_format)
+    try:
+        for chunk in microsimulation.read_chunks(source, chunk_size, input_format):
+            chunk, chunk_invalid = calculate_chunk(chunk, schedules)
+            records += len(chunk)
+            invalid += chunk_invalid
+            unmatched += int(chunk["owed"].isna().sum()) - chunk_invalid
+            writer.write(chunk)
+        writer.close()
+    except BaseException:
+        # Close the writer here rather than have it fail again when it is
+        # collected, and leave no half-written file behind
+        with contextlib.suppress(Exception):
+            writer.close()
+        if sink not in (sys.stdout, sys.stdout.buffer):
+            sink.close()
+            os.remove(output_path)
+        raise
+    finally:
+        if sink not in (sys.stdout, sys.stdout.buffer):
+            sink.close()
+        else:
+            sink.flush()
+    return records, unmatched, invalid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="""Calculate owed, effective and marginal
+                                     rate for every record of an income file""")
+    parser.add_argument("input", nargs="?", default="-", help="Input file, - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="Output file, - for stdout")
+    parser.add_argument("--from", dest="input_format", choices=FORMATS,
+                        help="Input format, from the file extension by default, else csv")
+    parser.add_argument("--to", dest="output_format", choices=FORMATS,
+                        help="Output format, from the file extension by default, else csv")
+    parser.add_argument("--chunk-size", type=int, default=microsimulation.CHUNK_SIZE)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    try:
+        records, unmatched, invalid = run_batch(args.input, args.output, args.input_format,
+                                                args.output_format, args.chunk_size)
+    except BrokenPipeError:
+        # The reader went away, e.g. piped into head. Point stdout at
+        # devnull so the interpreter's final flush doesn't fail again
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+    print(f"{records:,} records ({unmatched:,} without a schedule, {invalid:,} without a valid "
+          f"income) in {elapsed:.2f} s, "
+          f"{records / elapsed:,.0f} records per second", file=sys.stderr)
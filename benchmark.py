@@ -0,0 +1,228 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+import numpy as np
+import bracket_store
+import calculate_tax_data
+import chart_cache
+import schedule_algebra
+import tax_cents
+from bracket_schedule import BracketSchedule
+
+# Offline benchmarks over real schedules from bracket-data-store. Each case
+# is timed with timeit, the fastest of several repeats is kept as seconds
+# per call. Results are written as JSON, and a run compared against an
+# earlier one exits non-zero when any case got slower than the threshold.
+RESULTS_PATH = "benchmark-results.json"
+PARSER_PATH = os.path.join("bracket-data-sources", "bracket-data-parser.py")
+CSV_PATH = os.path.join("bracket-data-sources", "Historical Income Tax Rates and Brackets, 1862-2021.csv")
+# A modern schedule, the densest of the 1930s and a flat 1860s one
+SCHEDULES = {
+    "2023-7": ("United States", "2023", "Single Filer"),
+    "1932-55": ("United States", "1932", "Single Filer"),
+    "1867-1": ("United States", "1867", "Single Filer"),
+}
+BREAKDOWN_COUNTS = (1, 100)
+BATCH_COUNTS = (1, 1_000, 100_000)
+# Federal after a standard deduction, social security up to its wage base
+# and medicare, compiled to one schedule
+STACK_SCHEDULE = "2023-7"
+STANDARD_DEDUCTION = 13_850
+PAYROLL_RATES = ((0.062, 160_200), (0.0145, None))
+GRAPH_KINDS = ("bracket_breakdown", "bracket_step", "tax_owed", "interactive_breakdown")
+REPEAT = 5
+THRESHOLD = 1.3
+
+
+def load_raw_brackets(country, fiscal_year, filer_type):
+    path = os.path.join(bracket_store.SOURCE_PATH, country, fiscal_year, f"{filer_type}.json")
+    with open(path) as file:
+        return json.load(file)
+
+
+def get_top_income(schedule: BracketSchedule):
+    # Past the top bound, so every bracket is reached
+    return max(schedule.top_finite_bound * 1.2, 100_000)
+
+
+def get_incomes(schedule: BracketSchedule, count):
+    # Spread over every bracket, ending at the top income
+    return np.geomspace(1_000, get_top_income(schedule), count + 1)[1:]
+
+
+def load_parser():
+    spec = importlib.util.spec_from_file_location("bracket_data_parser", PARSER_PATH)
+    parser = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(parser)
+    return parser
+
+
+def read_packed_schedules(path):
+    # A fresh store every call, load_packed_store would hand back a cached one
+    store = bracket_store.PackedBracketStore(path)
+    return [store.get(*key) for key in store.keys()]
+
+
+def build_stack(schedule):
+    payroll = [schedule_algebra.flat_schedule(rate) for rate, _ in PAYROLL_RATES]
+    payroll = [schedule_algebra.cap_schedule(flat, wage_base) if wage_base else flat
+               for flat, (_, wage_base) in zip(payroll, PAYROLL_RATES)]
+    return schedule_algebra.stack_schedules(
+        schedule_algebra.deduct_from_schedule(schedule, STANDARD_DEDUCTION), *payroll)
+
+
+def get_chart_params(kind, schedule):
+    if kind == "bracket_breakdown":
+        return {"income": get_top_income(schedule)}
+    return {}
+
+
+def get_cases(temporary_path):
+    # {name: callable}, built up front so setup is never timed
+    cases = {}
+    for label, key in SCHEDULES.items():
+        raw = load_raw_brackets(*key)
+        schedule = BracketSchedule.from_dict(raw)
+        cases[f"coerce/{label}"] = lambda raw=raw: BracketSchedule.coerce(raw)
+        for count in BREAKDOWN_COUNTS:
+            incomes = get_incomes(schedule, count).tolist()
+            cases[f"breakdown_data/{label}/n={count}"] = lambda incomes=incomes, schedule=schedule: [
+                calculate_tax_data.calculate_tax_breakdown_data(income, schedule) for income in incomes]
+        for count in BATCH_COUNTS:
+            incomes = get_incomes(schedule, count)
+            cases[f"tax_batch/{label}/n={count}"] = lambda incomes=incomes, schedule=schedule: \
+                calculate_tax_data.calculate_tax_batch(incomes, schedule)
+            incomes_cents = tax_cents.dollars_to_cents(incomes)
+            cases[f"tax_batch_cents/{label}/n={count}"] = lambda incomes=incomes_cents, schedule=schedule: \
+                tax_cents.calculate_tax_batch_cents(incomes, schedule)
+        cases[f"cumulative_tax/{label}"] = lambda schedule=schedule: \
+            calculate_tax_data.calculate_cumulative_tax(get_top_income(schedule), schedule)
+        for kind in GRAPH_KINDS:
+            params = get_chart_params(kind, schedule)
+            build = lambda kind=kind, schedule=schedule, params=params: \
+                chart_cache.CHART_BUILDERS[kind](schedule, **params)
+            cases[f"graph/{kind}/{label}"] = build
+            cases[f"spec/{kind}/{label}"] = (build, lambda chart: chart.to_json(indent=None))
+    federal = BracketSchedule.from_dict(load_raw_brackets(*SCHEDULES[STACK_SCHEDULE]))
+    stack = build_stack(federal)
+    cases["stack/compile"] = lambda: build_stack(federal)
+    for count in BATCH_COUNTS:
+        incomes = get_incomes(stack, count)
+        cases[f"tax_batch/stack/n={count}"] = lambda incomes=incomes: \
+            calculate_tax_data.calculate_tax_batch(incomes, stack)
+    packed_path = os.path.join(temporary_path, "store.bin")
+    store_path = os.path.join(temporary_path, "store")
+    cases["load/walk_source_tree"] = lambda: list(bracket_store.walk_source_tree())
+    cases["load/build_packed_store"] = lambda: bracket_store.build_packed_store(
+        bracket_store.SOURCE_PATH, packed_path)
+    cases["load/packed_store_schedules"] = (lambda: bracket_store.build_packed_store(
+        bracket_store.SOURCE_PATH, packed_path), read_packed_schedules)
+    parser = load_parser()
+    cases["parser/parse_source"] = (lambda: parser.load_source(CSV_PATH),
+                                    lambda source: parser.parse_source(source))
+    cases["parser/run_pipeline"] = lambda: parser.run_pipeline(
+        CSV_PATH, store_path, incremental=False)
+    return cases
+
+
+def time_case(case, repeat=REPEAT):
+    # A case is a callable, or (setup, callable taking the setup's result)
+    if isinstance(case, tuple):
+        setup, function = case
+        argument = setup()
+        timer = timeit.Timer(lambda: function(argument))
+    else:
+        timer = timeit.Timer(case)
+    loops, _ = timer.autorange()
+    times = [elapsed / loops for elapsed in timer.repeat(repeat, loops)]
+    return {"seconds": min(times), "median": statistics.median(times), "loops": loops}
+
+
+def run_benchmarks(name_filter=None, repeat=REPEAT):
+    results = {}
+    with tempfile.TemporaryDirectory() as temporary_path:
+        for name, case in get_cases(temporary_path).items():
+            if name_filter and name_filter not in name:
+                continue
+            try:
+                results[name] = time_case(case, repeat)
+            except Exception as error:
+                results[name] = {"error": f"{type(error).__name__}: {error}"}
+            print(format_result(name, results[name]), flush=True)
+    return results
+
+
+def get_environment():
+    import altair
+    import pandas
+    return {"python": platform.python_version(), "numpy": np.__version__,
+            "pandas": pandas.__version__, "altair": altair.__version__,
+            "machine": platform.machine(), "system": platform.system(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def format_seconds(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:,.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:,.2f} ms"
+    return f"{seconds:,.2f} s"
+
+
+def format_result(name, result):
+    if "error" in result:
+        return f"{name:<48}{'error':>14}  {result['error']}"
+    return f"{name:<48}{format_seconds(result['seconds']):>14}"
+
+
+def compare_results(baseline, current, threshold=THRESHOLD):
+    # Cases that succeeded in the baseline, returns the regressed names
+    regressions = []
+    print(f"{'case':<48}{'baseline':>14}{'current':>14}{'ratio':>8}")
+    for name, result in current.items():
+        before = baseline.get(name)
+        if before is None or "seconds" not in before:
+            continue
+        if "error" in result:
+            # It ran before, failing now is a regression too
+            regressions.append(name)
+            print(f"{name:<48}{format_seconds(before['seconds']):>14}{'error':>14}")
+            continue
+        ratio = result["seconds"] / before["seconds"]
+        flag = ""
+        if ratio > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<48}{format_seconds(before['seconds']):>14}"
+              f"{format_seconds(result['seconds']):>14}{ratio:>8.2f}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time calculation, chart building and data loading")
+    parser.add_argument("--output", default=RESULTS_PATH, help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results from an earlier run")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="Fail when a case takes this many times its baseline")
+    parser.add_argument("--filter", help="Only run cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    args = parser.parse_args()
+    results = run_benchmarks(args.filter, args.repeat)
+    with open(args.output, "w") as file:
+        json.dump({"environment": get_environment(), "results": results}, file, indent=2)
+    print(f"Wrote {args.output}")
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare_results(baseline, results, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} cases regressed more than {args.threshold:.2f}x: "
+                  f"{', '.join(regressions)}")
+            sys.exit(1)
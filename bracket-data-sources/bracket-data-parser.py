@@ -1,11 +1,18 @@
 import pandas as pd
+import argparse
+import hashlib
 import json
 import pathlib
+import sys
+from concurrent.futures import ProcessPoolExecutor
 # This is tailored to the Tax Foundation's Historical Income Tax Rates csv
 # As such will not work on any other files or if they change the format of the file
 # A copy of the file used it maintained in this repo
-filer_types = ["Single Filer", "Married Filing Jointly", 
+filer_types = ["Single Filer", "Married Filing Jointly",
                "Married Filing Separately", "Head of Household"]
+CSV_PATH = "./bracket-data-sources/Historical Income Tax Rates and Brackets, 1862-2021.csv"
+STORE_PATH = "./bracket-data-store"
+COUNTRY = "United States"
 
 
 def identify_filer_type(string):
@@ -28,68 +35,129 @@ def format_percent(data):
     return data
 
 
-def write_data_to_json(country: str, year: str, filer_type: str, 
-                       bracket_dict: dict):
-    directory_path = f"./bracket-data-store/{country}/{year}/"
-    file_name = f"{filer_type}.json"
-    pathlib.Path(directory_path).mkdir(parents=True, exist_ok=True)
-    filepath = directory_path + file_name
+def get_json_path(country: str, year: str, filer_type: str, store_path=STORE_PATH):
+    return pathlib.Path(store_path) / country / year / f"{filer_type}.json"
+
+
+def write_data_to_json(country: str, year: str, filer_type: str,
+                       bracket_dict: dict, store_path=STORE_PATH):
+    filepath = get_json_path(country, year, filer_type, store_path)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
     with open(filepath,'w') as outfile:
         json.dump(bracket_dict, outfile)
 
 
-def parse_bracket(bracket: pd.DataFrame):
-    # Drop ">" column
-    bracket = bracket.drop(bracket.columns[-2], axis="columns")
-    # Replace % with float
-    bracket.iloc[:,1] = bracket.iloc[:,1].map(format_percent)
-    # Strip "$" and ","
-    bracket.iloc[:,-1] = bracket.iloc[:,-1].map(format_currency)
-    # Shift income column up
-    bracket.iloc[:,-1] = bracket.iloc[:,-1].shift(-1)
-    # Replace NaN with "inf"
-    bracket = bracket.infer_objects(copy=False).fillna("inf")
-    # Writeout
-    year = bracket.iloc[0,0]
-    filer_type = bracket.columns[1]
-    country = "United States"
-    # Create dict from data
-    key = bracket.columns[-1]
-    value = bracket.columns[1]
-    bracket_data = bracket[[key, value]].set_index(key).to_dict()[value]
-    # Write the file out
-    write_data_to_json(country, year, filer_type, bracket_data)
-
-
-def rename_column(target, new_name):
-    df.rename(columns={target:new_name}, inplace=True)
-
-
-# Read all csv data and drop the notes column as well as any empty rows
-df = pd.read_csv("./bracket-data-sources/Historical Income Tax Rates and Brackets, 1862-2021.csv")
-df = df.drop(["Notes:"], axis="columns")
-df = df.dropna(axis="index", how="any")
-years_u = df['Year'].unique() # Find all unique years
-
-
-# Rename columns to match my db names
-for col in df.columns.tolist():
-    # Try to rename filer type columns
+def content_hash(bracket_dict: dict):
+    return hashlib.sha256(json.dumps(bracket_dict).encode("utf-8")).hexdigest()
+
+
+def read_existing_hash(filepath: pathlib.Path):
+    # Hash the parsed content so hand formatted files still compare equal
     try:
-        filer_type = identify_filer_type(col)
-        rename_column(col, filer_type)
-    except ValueError:
-        pass
-
-# For each year, extract the tax brackets
-for year in years_u:
-    year_brackets = df.loc[df["Year"] == year] # Boolean masks when "Year"==year
-    for i in range(1, year_brackets.shape[1], 3):
-        # Get indices for each set of 3 columns of interest
-        cols=["Year"]
-        for j in range(i,i+3):
-            cols.append(year_brackets.iloc[:,j].name)
-        tax_bracket = year_brackets[cols]
-        parse_bracket(tax_bracket)
-
-    
\ No newline at end of file
+        with open(filepath) as file:
+            return content_hash(json.load(file))
+    except FileNotFoundError:
+        return None
+
+
+def parse_bracket(rates: list, bounds: list):
+    # Each rate applies above the bound on its row, so the upper bound of a
+    # bracket is the next row's bound and the top bracket is open ended
+    upper_bounds = [format_currency(bound) for bound in bounds[1:]] + ["inf"]
+    bracket_data = {}
+    for upper_bound, rate in zip(upper_bounds, rates):
+        bracket_data[upper_bound] = format_percent(rate)
+    return bracket_data
+
+
+def parse_year(year: str, columns: list, rows: list):
+    # Columns after "Year" come in sets of 3: rate, ">", bracket bound
+    parsed = []
+    for i in range(1, len(columns), 3):
+        filer_type = columns[i]
+        rates = [row[i] for row in rows]
+        bounds = [row[i+2] for row in rows]
+        parsed.append((year, filer_type, parse_bracket(rates, bounds)))
+    return parsed
+
+
+def load_source(csv_path=CSV_PATH):
+    # Read all csv data and drop the notes column as well as any empty rows
+    df = pd.read_csv(csv_path, dtype=str)
+    df = df.drop(["Notes:"], axis="columns")
+    df = df.dropna(axis="index", how="any")
+    # Rename columns to match my db names
+    renames = {}
+    for col in df.columns.tolist():
+        try:
+            renames[col] = identify_filer_type(col)
+        except ValueError:
+            pass
+    return df.rename(columns=renames)
+
+
+def parse_source(df: pd.DataFrame, workers=None):
+    # Split the rows by year in a single pass, keeping the file's year order
+    columns = df.columns.tolist()
+    year_groups = [(year, columns, rows.values.tolist())
+                   for year, rows in df.groupby("Year", sort=False)]
+    if workers is not None and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed_years = list(pool.map(parse_year, *zip(*year_groups)))
+    else:
+        parsed_years = [parse_year(*year_group) for year_group in year_groups]
+    return [bracket for parsed_year in parsed_years for bracket in parsed_year]
+
+
+def run_pipeline(csv_path=CSV_PATH, store_path=STORE_PATH, country=COUNTRY,
+                 workers=None, incremental=True):
+    summary = {"added": [], "changed": [], "unchanged": []}
+    for year, filer_type, bracket_data in parse_source(load_source(csv_path), workers):
+        filepath = get_json_path(country, year, filer_type, store_path)
+        existing_hash = read_existing_hash(filepath)
+        if existing_hash is None:
+            status = "added"
+        elif existing_hash != content_hash(bracket_data):
+            status = "changed"
+        else:
+            status = "unchanged"
+        summary[status].append(f"{country}/{year}/{filer_type}")
+        if status != "unchanged" or not incremental:
+            write_data_to_json(country, year, filer_type, bracket_data, store_path)
+    return summary
+
+
+def print_summary(summary: dict):
+    for status in ["added", "changed"]:
+        for name in summary[status]:
+            print(f"{status:>9}: {name}")
+    print(f"{len(summary['added'])} added, {len(summary['changed'])} changed, "
+          f"{len(summary['unchanged'])} unchanged")
+
+
+def pack_store(store_path=STORE_PATH):
+    # The packed store and the tree manifest live with the app modules in the
+    # repo root, both are rebuilt so the app's menus match the store
+    sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+    import bracket_store
+    return (bracket_store.build_packed_store(store_path),
+            bracket_store.build_tree_manifest(store_path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild bracket-data-store from the Tax Foundation csv")
+    parser.add_argument("--csv", default=CSV_PATH)
+    parser.add_argument("--store", default=STORE_PATH)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Parse years on a process pool of this size")
+    parser.add_argument("--full", action="store_true",
+                        help="Rewrite every file, even when its content is unchanged")
+    parser.add_argument("--pack", action="store_true",
+                        help="Rebuild the packed bracket store and tree manifest afterwards")
+    args = parser.parse_args()
+    summary = run_pipeline(args.csv, args.store, workers=args.workers,
+                           incremental=not args.full)
+    print_summary(summary)
+    if args.pack:
+        for path in pack_store(args.store):
+            print(f"Wrote {path}")
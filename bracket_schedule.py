@@ -0,0 +1,98 @@
+import hashlib
+import weakref
+import numpy as np
+
+
+def parse_bracket_bound(bound):
+    # Bounds come from JSON as strings, "inf" marks the open top bracket
+    if isinstance(bound, str):
+        bound = bound.strip()
+    return float(bound)
+
+
+class BracketSchedule:
+    # Immutable, array-backed form of a {upper bound: rate} bracket dict
+    __slots__ = ("bracket_low", "bracket_high", "bracket_rate", "cum_owed_low",
+                 "top_finite_bound", "digest", "_hash", "__weakref__")
+    # Live schedules by content digest, identical brackets share one object
+    _interned = weakref.WeakValueDictionary()
+
+    def __init__(self, bracket_high, bracket_rate):
+        bracket_high = np.asarray(bracket_high, dtype=np.float64)
+        bracket_rate = np.asarray(bracket_rate, dtype=np.float64)
+        if bracket_high.ndim != 1 or bracket_high.shape != bracket_rate.shape:
+            raise ValueError("Bracket bounds and rates must be matching 1-D arrays")
+        if len(bracket_high) == 0:
+            raise ValueError("A bracket schedule needs at least one bracket")
+        order = np.argsort(bracket_high, kind="stable")
+        bracket_high = bracket_high[order]
+        bracket_rate = bracket_rate[order]
+        if np.isfinite(bracket_high[-1]):
+            raise ValueError("The top bracket must be unbounded (inf)")
+        bracket_low = np.concatenate(([0.0], bracket_high[:-1]))
+        # Tax owed on every full bracket below each bracket's lower bound
+        full_bracket_owed = (bracket_high[:-1] - bracket_low[:-1]) * bracket_rate[:-1]
+        cum_owed_low = np.concatenate(([0.0], np.cumsum(full_bracket_owed)))
+        for array in (bracket_low, bracket_high, bracket_rate, cum_owed_low):
+            array.flags.writeable = False
+        finite_bounds = bracket_high[np.isfinite(bracket_high)]
+        top_finite_bound = float(finite_bounds.max()) if len(finite_bounds) else 0.0
+        digest = hashlib.sha1(bracket_high.tobytes() + bracket_rate.tobytes()).hexdigest()
+
+        set_slot = object.__setattr__
+        set_slot(self, "bracket_low", bracket_low)
+        set_slot(self, "bracket_high", bracket_high)
+        set_slot(self, "bracket_rate", bracket_rate)
+        set_slot(self, "cum_owed_low", cum_owed_low)
+        set_slot(self, "top_finite_bound", top_finite_bound)
+        set_slot(self, "digest", digest)
+        set_slot(self, "_hash", hash(digest))
+
+    @classmethod
+    def interned(cls, bracket_high, bracket_rate):
+        schedule = cls(bracket_high, bracket_rate)
+        return cls._interned.setdefault(schedule.digest, schedule)
+
+    @classmethod
+    def from_dict(cls, brackets: dict):
+        bracket_high = [parse_bracket_bound(bound) for bound in brackets.keys()]
+        bracket_rate = [float(rate) for rate in brackets.values()]
+        return cls.interned(bracket_high, bracket_rate)
+
+    @classmethod
+    def coerce(cls, brackets):
+        # Accept either a compiled schedule or a raw/coerced bracket dict
+        if isinstance(brackets, cls):
+            return brackets
+        return cls.from_dict(brackets)
+
+    def to_dict(self):
+        return {(int(high) if np.isfinite(high) and high.is_integer() else float(high)):
+                float(rate) for high, rate in zip(self.bracket_high, self.bracket_rate)}
+
+    def finite_bounds(self):
+        return self.bracket_high[:-1]
+
+    def __len__(self):
+        return len(self.bracket_high)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("BracketSchedule is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("BracketSchedule is immutable")
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if not isinstance(other, BracketSchedule):
+            return NotImplemented
+        return self.digest == other.digest
+
+    def __reduce__(self):
+        return (self.__class__.interned,
+                (np.array(self.bracket_high), np.array(self.bracket_rate)))
+
+    def __repr__(self):
+        return f"BracketSchedule({len(self)} brackets, digest={self.digest[:12]})"
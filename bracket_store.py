@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import struct
+import functools
+import warnings
+import numpy as np
+from bracket_schedule import BracketSchedule
+
+# The JSON tree in bracket-data-store/ is the editable source. This module
+# compiles it into one packed file that loads with a single mmap.
+#
+# Layout (little endian):
+#   magic "BRKT" | version u32 | index length u32 | bracket count u32
+#   JSON index, padded to 8 bytes
+#   float64 bracket upper bounds, one blob per unique schedule, back to back
+#   float64 bracket rates, same order
+# The index holds "blobs", a list of [offset, length, digest] into both
+# arrays, and "tree", mapping country -> year -> filer -> blob number. Years
+# and filer types with identical brackets point at the same blob. "source"
+# fingerprints the JSON tree it was built from, a store that no longer
+# matches its source is never read.
+SOURCE_PATH = "bracket-data-store"
+PACKED_STORE_PATH = "bracket-data-store.bin"
+# Just the country -> year -> filer listing, for building menus without
+# listing directories or opening the store
+TREE_MANIFEST_PATH = "bracket-data-store.tree.json"
+MAGIC = b"BRKT"
+VERSION = 2
+HEADER = struct.Struct("<4sIII")
+
+
+def sort_years(years):
+    # Years are directory names such as 1940 or 1940(A), order them by the
+    # leading year so a variant sits next to its plain year
+    return sorted(years, key=lambda year: (int(year[:4]), year))
+
+
+def walk_source_tree(source_path=SOURCE_PATH):
+    # Yield (country, year, filer, raw bracket dict) for every JSON file
+    for country in sorted(os.listdir(source_path)):
+        country_path = os.path.join(source_path, country)
+        if not os.path.isdir(country_path):
+            continue
+        for year in sort_years(os.listdir(country_path)):
+            year_path = os.path.join(country_path, year)
+            if not os.path.isdir(year_path):
+                continue
+            for file_name in sorted(os.listdir(year_path)):
+                if not file_name.endswith(".json"):
+                    continue
+                with open(os.path.join(year_path, file_name)) as file:
+                    brackets = json.load(file)
+                yield country, year, file_name.removesuffix(".json"), brackets
+
+
+def get_source_fingerprint(source_path=SOURCE_PATH):
+    # Hash of every JSON file's path, size and modification time, None
+    # without a source tree. A few milliseconds for the whole tree
+    if not os.path.isdir(source_path):
+        return None
+    entries = []
+    directories = [source_path]
+    while directories:
+        with os.scandir(directories.pop()) as scan:
+            for entry in scan:
+                if entry.is_dir():
+                    directories.append(entry.path)
+                elif entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    entries.append((entry.path[len(source_path):], stat.st_size, stat.st_mtime_ns))
+    return hashlib.sha256(repr(sorted(entries)).encode()).hexdigest()
+
+
+def build_packed_store(source_path=SOURCE_PATH, output_path=PACKED_STORE_PATH):
+    # Fingerprinted before reading, an edit made during the build marks the
+    # store stale rather than slipping past
+    source = get_source_fingerprint(source_path)
+    tree = {}
+    blobs = []
+    blob_numbers = {}
+    bounds = []
+    rates = []
+    offset = 0
+    for country, year, filer, brackets in walk_source_tree(source_path):
+        # Compile first so the content hash ignores key order and formatting
+        schedule = BracketSchedule.from_dict(brackets)
+        if schedule.digest not in blob_numbers:
+            blob_numbers[schedule.digest] = len(blobs)
+            blobs.append([offset, len(schedule), schedule.digest])
+            bounds.extend(schedule.bracket_high)
+            rates.extend(schedule.bracket_rate)
+            offset += len(schedule)
+        tree.setdefault(country, {}).setdefault(year, {})[filer] = blob_numbers[schedule.digest]
+    index = {"blobs": blobs, "tree": tree, "source": source}
+    index_bytes = json.dumps(index, separators=(",", ":")).encode("utf-8")
+    index_bytes += b" " * (-(HEADER.size + len(index_bytes)) % 8)
+    # Write to a temporary file first so readers never see a partial store
+    temporary_path = output_path + ".tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(index_bytes), offset))
+        file.write(index_bytes)
+        file.write(np.asarray(bounds, dtype="<f8").tobytes())
+        file.write(np.asarray(rates, dtype="<f8").tobytes())
+    os.replace(temporary_path, output_path)
+    return output_path
+
+
+def build_tree_manifest(source_path=SOURCE_PATH, output_path=TREE_MANIFEST_PATH):
+    # Same shape as PackedBracketStore.tree()
+    tree = {}
+    for country, year, filer, _ in walk_source_tree(source_path):
+        tree.setdefault(country, {}).setdefault(year, {})[filer] = f"{country}/{year}/{filer}.json"
+    temporary_path = output_path + ".tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(tree, file, separators=(",", ":"))
+    os.replace(temporary_path, output_path)
+    return output_path
+
+
+def load_tree_manifest(path=TREE_MANIFEST_PATH):
+    # None when the manifest has not been built
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+# Listings of a tree as returned by PackedBracketStore.tree(), the manifest
+# or the GitHub tree
+def get_country_options(file_tree):
+    countries = []
+    for country in file_tree.keys():
+        countries.append(country)
+    return countries
+
+
+def get_year_options(file_tree):
+    fiscal_years = []
+    for fiscal_year in file_tree.keys():
+        fiscal_years.append(fiscal_year)
+    # Reverse to show most recent years first
+    fiscal_years.reverse()
+    return fiscal_years
+
+
+def get_filer_options(file_tree):
+    filer_types = []
+    for filer_type in file_tree.keys():
+        # The filer type is part of the file name, remove the extension
+        filer_type = filer_type.removesuffix(".json")
+        filer_types.append(filer_type)
+    return filer_types
+
+
+class PackedBracketStore:
+    def __init__(self, path=PACKED_STORE_PATH):
+        self.path = path
+        self.buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, index_length, bracket_count = HEADER.unpack(
+            self.buffer[:HEADER.size].tobytes())
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} packed bracket store")
+        index_end = HEADER.size + index_length
+        index = json.loads(self.buffer[HEADER.size:index_end].tobytes())
+        self.blobs = index["blobs"]
+        self.index = index["tree"]
+        self.source = index.get("source")
+        data_bytes = bracket_count * 8
+        self.bounds = self.buffer[index_end:index_end + data_bytes].view("<f8")
+        self.rates = self.buffer[index_end + data_bytes:index_end + 2 * data_bytes].view("<f8")
+        # One schedule object per blob, shared by every key that points at it
+        self.schedules = {}
+
+    def locate(self, country, fiscal_year, filer_type):
+        try:
+            return self.index[country][str(fiscal_year)][filer_type]
+        except KeyError:
+            raise ValueError("Specified Data Does Not Exist")
+
+    def get_blob(self, blob_number):
+        schedule = self.schedules.get(blob_number)
+        if schedule is None:
+            offset, length, _ = self.blobs[blob_number]
+            schedule = BracketSchedule.interned(self.bounds[offset:offset + length],
+                                                self.rates[offset:offset + length])
+            self.schedules[blob_number] = schedule
+        return schedule
+
+    def get(self, country, fiscal_year, filer_type):
+        return self.get_blob(self.locate(country, fiscal_year, filer_type))
+
+    def digest(self, country, fiscal_year, filer_type):
+        return self.blobs[self.locate(country, fiscal_year, filer_type)][2]
+
+    def keys(self):
+        for country, years in self.index.items():
+            for year, filers in years.items():
+                for filer in filers.keys():
+                    yield country, year, filer
+
+    def unique_keys(self):
+        # One (country, year, filer) representative per unique schedule
+        seen = set()
+        for key in self.keys():
+            blob_number = self.locate(*key)
+            if blob_number not in seen:
+                seen.add(blob_number)
+                yield key
+
+    def tree(self):
+        # Same shape as get_tax_database_local: leaves are the relative JSON path
+        return {country: {year: {filer: f"{country}/{year}/{filer}.json"
+                                 for filer in filers}
+                          for year, filers in years.items()}
+                for country, years in self.index.items()}
+
+
+@functools.lru_cache(maxsize=4)
+def open_packed_store(path, modified_time):
+    # The modification time is part of the key so a rebuilt store is reopened
+    return PackedBracketStore(path)
+
+
+def load_packed_store(path=PACKED_STORE_PATH, source_path=SOURCE_PATH):
+    # None when the store has not been built or is older than the JSON tree,
+    # callers fall back to the JSON tree. Without a JSON tree the store is used
+    try:
+        modified_time = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    store = open_packed_store(path, modified_time)
+    source = get_source_fingerprint(source_path)
+    if source is not None and source != store.source:
+        warnings.warn(f"{path} does not match {source_path}, reading the JSON tree instead. "
+                      f"Rebuild it with python bracket_store.py", stacklevel=2)
+        return None
+    return store
+
+
+def load_schedule(country, fiscal_year, filer_type, source_path=SOURCE_PATH,
+                  packed_path=PACKED_STORE_PATH):
+    # One schedule, from the packed store when it is up to date
+    store = load_packed_store(packed_path, source_path)
+    if store is not None:
+        return store.get(country, fiscal_year, filer_type)
+    with open(os.path.join(source_path, country, fiscal_year, f"{filer_type}.json")) as file:
+        return BracketSchedule.from_dict(json.load(file))
+
+
+def load_schedules(source_path=SOURCE_PATH, packed_path=PACKED_STORE_PATH):
+    # Every schedule as {(country, year, filer): BracketSchedule}, read from
+    # the packed store when it is up to date, otherwise from the JSON tree
+    store = load_packed_store(packed_path, source_path)
+    if store is not None:
+        return {key: store.get(*key) for key in store.keys()}
+    return {(country, year, filer): BracketSchedule.from_dict(brackets)
+            for country, year, filer, brackets in walk_source_tree(source_path)}
+
+
+if __name__ == "__main__":
+    print(f"Wrote {build_packed_store()}")
+    print(f"Wrote {build_tree_manifest()}")
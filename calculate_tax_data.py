@@ -1,66 +1,197 @@
-import pandas as pd
-import warnings
 import numpy as np
+from bracket_schedule import BracketSchedule
+
+# pandas is only imported by the functions that return frames, the array
+# paths stay importable without it
 
 
 def apply_tax_to_bracket(lower_limit: int, upper_limit: int, rate: float):
     return (upper_limit - lower_limit) * rate
 
 
-def add_row_to_data(data: pd.DataFrame, row: pd.DataFrame):
-    data = pd.concat([data, row], ignore_index=True)
-    return data
-
-
-def calculate_tax_breakdown_data(income: int, brackets: dict):
-    df_keys = ["bracket_low", "bracket_high", "bracket_rate", 
-                "bracket_owed", "cum_owed_low", "cum_owed_high"]
-    tax_breakdown_data = pd.DataFrame(columns=df_keys)
-    # Starting range
-    bracket_high_bound = list(brackets.keys())[0]
-    bracket_low_bound = 0
-    cumulative_owed_low = 0
-    for bracket_high_bound in brackets.keys():
-        bracket_rate = brackets[bracket_high_bound]
-        bracket_high_value = min(income, bracket_high_bound)
-        bracket_owed = apply_tax_to_bracket(bracket_low_bound, 
-                                            bracket_high_value, 
-                                            bracket_rate)
-        cumulative_owed_high = cumulative_owed_low + bracket_owed
-        if bracket_owed > 0:
-            df_values = [bracket_low_bound, bracket_high_bound,
-                            bracket_rate, bracket_owed,
-                            cumulative_owed_low, cumulative_owed_high]
-            data_row = pd.DataFrame(dict(zip(df_keys, df_values)), index=[0])
-            tax_breakdown_data = add_row_to_data(tax_breakdown_data, data_row)
-            # Update for next iteration
-            bracket_low_bound = bracket_high_bound
-            cumulative_owed_low = cumulative_owed_high
+def find_brackets(incomes, schedule: BracketSchedule):
+    # Find the bracket each income ends in, an income sitting exactly on a
+    # bound pays the next bracket's rate on its next dollar
+    index = np.searchsorted(schedule.bracket_high, incomes, side="right")
+    return np.minimum(index, len(schedule.bracket_high) - 1)
+
+
+def calculate_tax_owed(incomes, brackets):
+    # Only the amount owed, without the per bracket breakdown
+    schedule = BracketSchedule.coerce(brackets)
+    incomes = np.clip(np.asarray(incomes, dtype=float), 0, None)
+    index = find_brackets(incomes, schedule)
+    return (schedule.cum_owed_low[index] +
+            apply_tax_to_bracket(schedule.bracket_low[index], incomes,
+                                 schedule.bracket_rate[index]))
+
+
+def calculate_tax_batch(incomes, brackets):
+    schedule = BracketSchedule.coerce(brackets)
+    bracket_low = schedule.bracket_low
+    bracket_high = schedule.bracket_high
+    bracket_rate = schedule.bracket_rate
+    cum_owed_low = schedule.cum_owed_low
+    incomes = np.clip(np.asarray(incomes, dtype=float), 0, None)
+    index = find_brackets(incomes, schedule)
+    owed = (cum_owed_low[index] + 
+            apply_tax_to_bracket(bracket_low[index], incomes, bracket_rate[index]))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        effective_rate = np.where(incomes > 0, owed / incomes, 0.0)
+    # Portion of each income that falls inside each bracket
+    bracket_income = np.clip(incomes[:, None] - bracket_low[None, :], 0,
+                             bracket_high - bracket_low)
+    return {
+        "income": incomes,
+        "owed": owed,
+        "effective_rate": effective_rate,
+        "marginal_rate": bracket_rate[index],
+        "bracket_low": bracket_low,
+        "bracket_high": bracket_high,
+        "bracket_rate": bracket_rate,
+        "bracket_owed": bracket_income * bracket_rate,
+        "cum_owed_low": cum_owed_low,
+    }
+
+
+def calculate_tax_breakdown_data(income: int, brackets):
+    batch = calculate_tax_batch([income], brackets)
+    # Only keep the brackets the income reaches into
+    reached = batch["bracket_low"] < batch["income"][0]
+    bracket_owed = batch["bracket_owed"][0][reached]
+    cum_owed_low = batch["cum_owed_low"][reached]
+    import pandas as pd
+    tax_breakdown_data = pd.DataFrame({
+        "bracket_low": batch["bracket_low"][reached],
+        "bracket_high": batch["bracket_high"][reached],
+        "bracket_rate": batch["bracket_rate"][reached],
+        "bracket_owed": bracket_owed,
+        "cum_owed_low": cum_owed_low,
+        "cum_owed_high": cum_owed_low + bracket_owed,
+    })
     return tax_breakdown_data
 
 
-def calculate_cumulative_tax(income: int, brackets: dict, interp=3):
-    warnings.simplefilter(action='ignore', category=FutureWarning)
-    df_keys = ["Income", "Owed", "Eff. Tax Rate"]
-    cumulative_data = pd.DataFrame(columns=df_keys)
-    # Calculate N points between bracket bounds
-    lower_bound = 0
-    owed = 0
-    for upper_bound, bracket_rate in brackets.items():
-        # When the bound is infinite, the income is the upper bound
-        if not np.isfinite(upper_bound):
-            upper_bound = income
-        # linspace equivalent
-        pts = [lower_bound + n*(upper_bound-lower_bound)/interp
-               for n in range(interp)] + [upper_bound]
-        # Calculate the cumulative owed amount at each interval
-        for i in range(1, len(pts), 1):
-            top = pts[i]
-            bottom = pts[i-1]
-            owed = owed + (top - bottom) * bracket_rate
-            df_values = [top, owed, bracket_rate]
-            data_row = pd.DataFrame(dict(zip(df_keys, df_values)), index=[0])
-            cumulative_data = add_row_to_data(cumulative_data, data_row)
-        # Update for next bracket
-        lower_bound = upper_bound
-    return cumulative_data
\ No newline at end of file
+def calculate_cumulative_tax(income: int, brackets, interp=3, adaptive=False,
+                             as_arrays=False):
+    schedule = BracketSchedule.coerce(brackets)
+    # Owed is linear inside each bracket, so every point is exact from the
+    # bracket's lower bound. Brackets above the income are not drawn and the
+    # last drawn bracket stops at the income
+    reached = schedule.bracket_low < income
+    bracket_low = schedule.bracket_low[reached]
+    bracket_high = np.minimum(schedule.bracket_high[reached], income)
+    bracket_rate = schedule.bracket_rate[reached]
+    cum_owed_low = schedule.cum_owed_low[reached]
+    bracket_width = bracket_high - bracket_low
+    if adaptive:
+        # Spread the same point budget by bracket width, wide brackets get
+        # more points, every bracket keeps at least its upper breakpoint
+        budget = interp * len(bracket_width)
+        # Width over income first, the product overflows for huge incomes
+        counts = np.clip(np.round(budget * (bracket_width / max(income, 1))), 1, budget)
+        counts = counts.astype(int)
+    else:
+        counts = np.full(len(bracket_width), interp, dtype=int)
+    # Fractions (1..n)/n of the way through each bracket, the final one of
+    # each bracket lands exactly on its upper breakpoint
+    point_bracket = np.repeat(np.arange(len(counts)), counts)
+    point_step = np.arange(len(point_bracket)) - np.repeat(np.cumsum(counts) - counts, counts)
+    fraction = (point_step + 1) / counts[point_bracket]
+    points = bracket_low[point_bracket] + fraction * bracket_width[point_bracket]
+    owed = (cum_owed_low[point_bracket] + 
+            apply_tax_to_bracket(bracket_low[point_bracket], points,
+                                 bracket_rate[point_bracket]))
+    rates = bracket_rate[point_bracket]
+    if as_arrays:
+        return {"income": points, "owed": owed, "bracket_rate": rates}
+    import pandas as pd
+    cumulative_data = pd.DataFrame({
+        "Income": points,
+        "Owed": owed,
+        "Eff. Tax Rate": rates,
+    })
+    return cumulative_data
+
+
+def solve_income_for_owed(bracket_low, bracket_high, bracket_rate, cum_owed_low,
+                          targets):
+    # Bracket arrays are (schedules x brackets), padding above the open top
+    # bracket has an infinite lower bound. Returns (schedules x targets)
+    with np.errstate(invalid="ignore"):
+        cum_owed_high = np.where(np.isfinite(bracket_high),
+                                 cum_owed_low + (bracket_high - bracket_low) * bracket_rate,
+                                 np.where(bracket_rate > 0, np.inf, cum_owed_low))
+    cum_owed_high = np.where(np.isfinite(bracket_low), cum_owed_high, np.nan)
+    # Owed never falls as income rises, take the first bracket that gets there
+    reaches = cum_owed_high[:, :, None] >= targets[None, None, :]
+    index = reaches.argmax(axis=1)
+    found = reaches.any(axis=1)
+    low = np.take_along_axis(bracket_low, index, axis=1)
+    rate = np.take_along_axis(bracket_rate, index, axis=1)
+    owed_low = np.take_along_axis(cum_owed_low, index, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        income = np.where(targets[None, :] <= owed_low, low,
+                          low + (targets[None, :] - owed_low) / rate)
+    return np.where(found, income, np.nan)
+
+
+def solve_income_for_effective_rate(bracket_low, bracket_high, bracket_rate,
+                                    cum_owed_low, targets):
+    # Inside a bracket owed/income = target is linear in income:
+    #   cum_owed_low + (income - low) * rate = target * income
+    low = bracket_low[:, :, None]
+    high = bracket_high[:, :, None]
+    rate = bracket_rate[:, :, None]
+    owed_low = cum_owed_low[:, :, None]
+    target = targets[None, None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        same_rate = np.isclose(rate, target)
+        income = (low * rate - owed_low) / (rate - target)
+        solved = ~same_rate & (income >= low) & (income <= high) & (income > 0)
+        # A bracket whose rate already equals the target from its lower bound
+        flat = same_rate & np.isclose(low * rate, owed_low)
+    income = np.where(flat & ~solved, low, income)
+    income = np.where((solved | flat) & np.isfinite(low), income, np.inf).min(axis=1)
+    # No income means no tax, a 0% target is met from the start
+    income = np.where(targets[None, :] == 0, 0.0, income)
+    return np.where(np.isfinite(income), income, np.nan)
+
+
+def solve_income_range_for_marginal_rate(bracket_low, bracket_high, bracket_rate,
+                                         targets):
+    # The first bracket taxed at each target rate, (schedules x targets) each
+    matches = np.isclose(bracket_rate[:, :, None], targets[None, None, :])
+    matches &= np.isfinite(bracket_low)[:, :, None]
+    index = matches.argmax(axis=1)
+    found = matches.any(axis=1)
+    low = np.take_along_axis(bracket_low, index, axis=1)
+    high = np.take_along_axis(bracket_high, index, axis=1)
+    return np.where(found, low, np.nan), np.where(found, high, np.nan)
+
+
+def schedule_arrays(brackets):
+    schedule = BracketSchedule.coerce(brackets)
+    return (schedule.bracket_low[None, :], schedule.bracket_high[None, :],
+            schedule.bracket_rate[None, :], schedule.cum_owed_low[None, :])
+
+
+def calculate_income_for_owed(owed, brackets):
+    # Smallest income that owes each target amount
+    targets = np.atleast_1d(np.asarray(owed, dtype=float))
+    return solve_income_for_owed(*schedule_arrays(brackets), targets)[0]
+
+
+def calculate_income_for_effective_rate(effective_rate, brackets):
+    # Smallest income taxed at each target effective rate, nan if no income is
+    targets = np.atleast_1d(np.asarray(effective_rate, dtype=float))
+    return solve_income_for_effective_rate(*schedule_arrays(brackets), targets)[0]
+
+
+def calculate_income_range_for_marginal_rate(marginal_rate, brackets):
+    # (low, high) income range taxed at each target marginal rate
+    targets = np.atleast_1d(np.asarray(marginal_rate, dtype=float))
+    bracket_low, bracket_high, bracket_rate, _ = schedule_arrays(brackets)
+    low, high = solve_income_range_for_marginal_rate(bracket_low, bracket_high,
+                                                     bracket_rate, targets)
+    return low[0], high[0]
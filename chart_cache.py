@@ -0,0 +1,226 @@
+import argparse
+import collections
+import functools
+import gzip
+import hashlib
+import importlib.metadata
+import json
+import os
+import re
+import threading
+import bracket_store
+import instrumentation
+from bracket_schedule import BracketSchedule
+
+# Finished Vega-Lite specs for charts that depend only on the schedule (and
+# fixed parameters), keyed by schedule content so identical schedules share
+# an entry. One cache per process, shared by every session.
+CACHE_ENTRIES = 256
+PRERENDER_PATH = "chart-spec-cache"
+# Sources whose changes alter the specs
+BUILDER_SOURCES = ("create_graph.py", "chart_cache.py", "calculate_tax_data.py",
+                   "bracket_schedule.py")
+
+
+class LRUCache:
+    def __init__(self, max_entries=CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_or_create(self, key, factory):
+        # Built outside the lock, two sessions racing on a miss both build
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses}
+
+
+# create_graph pulls in altair and pandas, it is only imported when a spec
+# actually has to be built rather than read back from the cache or disk
+def draw_bracket_step(schedule, buffer=1.2):
+    import create_graph
+    return create_graph.TaxBracketStepGraph(schedule, buffer).get_chart()
+
+
+def draw_tax_owed(schedule, buffer=1.2):
+    import create_graph
+    return create_graph.TaxOwedGraph(schedule, buffer).get_chart()
+
+
+def draw_bracket_breakdown(schedule, income):
+    import calculate_tax_data
+    import create_graph
+    data = calculate_tax_data.calculate_tax_breakdown_data(income, schedule)
+    return create_graph.TaxBracketBreakdownGraph(data, income, schedule).get_full_combochart()
+
+
+def draw_interactive_breakdown(schedule):
+    import create_graph
+    return create_graph.TaxBracketInteractiveGraph(schedule).get_full_combochart()
+
+
+CHART_BUILDERS = {
+    "bracket_step": draw_bracket_step,
+    "tax_owed": draw_tax_owed,
+    "bracket_breakdown": draw_bracket_breakdown,
+    "interactive_breakdown": draw_interactive_breakdown,
+}
+
+chart_spec_cache = LRUCache()
+
+
+@functools.lru_cache(maxsize=None)
+def get_builder_hash(sources=BUILDER_SOURCES, salt=""):
+    # Changes with the altair version and the chart code, so specs written
+    # by an older build are never read back. The version comes from package
+    # metadata, altair itself is not imported
+    builder = hashlib.sha256(f"{importlib.metadata.version('altair')} {salt}".encode())
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in sources:
+        with open(os.path.join(directory, name), "rb") as file:
+            builder.update(file.read())
+    return builder.hexdigest()
+
+
+def get_prerender_file(kind, digest, params, prerender_path=PRERENDER_PATH):
+    # Only charts drawn with their default parameters are pre-rendered
+    if params:
+        return None
+    return os.path.join(prerender_path, f"{kind}-{digest}-{get_builder_hash()[:16]}.json")
+
+
+def build_chart_spec(kind, schedule, **params):
+    return CHART_BUILDERS[kind](schedule, **params).to_json(indent=None)
+
+
+def load_chart_spec(kind, schedule, params):
+    instrumentation.record_cache_miss()
+    prerender_file = get_prerender_file(kind, schedule.digest, params)
+    if prerender_file is not None:
+        try:
+            with open(prerender_file) as file:
+                return file.read()
+        except FileNotFoundError:
+            pass
+    return build_chart_spec(kind, schedule, **params)
+
+
+def get_chart_spec(kind, brackets, **params):
+    # The spec as a dict, ready for st.vega_lite_chart
+    schedule = BracketSchedule.coerce(brackets)
+    key = (kind, schedule.digest, tuple(sorted(params.items())))
+    spec = chart_spec_cache.get_or_create(
+        key, lambda: load_chart_spec(kind, schedule, params))
+    return json.loads(spec)
+
+
+def set_breakdown_income(spec: dict, income, bind=True):
+    # Fill in an interactive_breakdown spec's starting income. Without the
+    # bind it draws the same chart as bracket_breakdown, at no cost per income
+    for param in spec["params"]:
+        if param["name"] == "income":
+            param["value"] = income
+            if not bind:
+                del param["bind"]
+    return spec
+
+
+def get_interactive_breakdown_spec(brackets, income, bind=True):
+    # One cached spec per schedule, only the starting income is filled in
+    return set_breakdown_income(get_chart_spec("interactive_breakdown", brackets), income, bind)
+
+
+def prerender_chart_specs(prerender_path=PRERENDER_PATH,
+                          kinds=("bracket_step", "tax_owed", "interactive_breakdown")):
+    # Write every unique schedule's specs to disk ahead of time
+    os.makedirs(prerender_path, exist_ok=True)
+    unique = {schedule.digest: schedule for schedule in bracket_store.load_schedules().values()}
+    written = set()
+    for digest, schedule in unique.items():
+        for kind in kinds:
+            prerender_file = get_prerender_file(kind, digest, {}, prerender_path)
+            with open(prerender_file, "w") as file:
+                file.write(build_chart_spec(kind, schedule))
+            written.add(os.path.basename(prerender_file))
+    # Files of older builds can never be read again. Only names this tool
+    # writes are pruned, anything else in the directory is left alone
+    prerender_name = re.compile(rf"({'|'.join(CHART_BUILDERS)})-[0-9a-f]{{40}}-[0-9a-f]{{16}}\.json")
+    for file_name in os.listdir(prerender_path):
+        if prerender_name.fullmatch(file_name) and file_name not in written:
+            os.remove(os.path.join(prerender_path, file_name))
+    return len(unique)
+
+
+def spec_payload_report(spec: str):
+    # Bytes sent to the browser for one spec, and how much of it is data
+    datasets = json.loads(spec).get("datasets", {})
+    return {
+        "bytes": len(spec.encode("utf-8")),
+        "gzip_bytes": len(gzip.compress(spec.encode("utf-8"))),
+        "datasets": len(datasets),
+        "dataset_bytes": len(json.dumps(datasets, separators=(",", ":")).encode("utf-8")),
+    }
+
+
+def print_payload_report(country="United States", filer="Single Filer", income=65000):
+    # Payload of each chart for every year of one filer type
+    schedules = bracket_store.load_schedules()
+    years = bracket_store.sort_years({key[1] for key in schedules if key[0] == country})
+    print(f"{'chart':<18}{'specs':>7}{'failed':>8}{'mean bytes':>12}{'max bytes':>11}"
+          f"{'mean gzip':>11}")
+    for kind in CHART_BUILDERS:
+        params = {"income": income} if kind == "bracket_breakdown" else {}
+        reports = []
+        failed = 0
+        for year in years:
+            if (country, year, filer) not in schedules:
+                continue
+            try:
+                spec = build_chart_spec(kind, schedules[(country, year, filer)], **params)
+            except ValueError:
+                failed += 1
+                continue
+            reports.append(spec_payload_report(spec))
+        sizes = [report["bytes"] for report in reports]
+        gzip_sizes = [report["gzip_bytes"] for report in reports]
+        print(f"{kind:<18}{len(reports):>7}{failed:>8}{sum(sizes) / len(sizes):>12,.0f}"
+              f"{max(sizes):>11,}{sum(gzip_sizes) / len(gzip_sizes):>11,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-render schedule-only chart specs")
+    parser.add_argument("--output", default=PRERENDER_PATH)
+    parser.add_argument("--report", action="store_true",
+                        help="Print spec payload sizes instead of pre-rendering")
+    args = parser.parse_args()
+    if args.report:
+        print_payload_report()
+    else:
+        count = prerender_chart_specs(args.output)
+        print(f"Pre-rendered specs for {count} unique schedules in {args.output}")
@@ -0,0 +1,134 @@
+import argparse
+import decimal
+import sys
+import time
+import numpy as np
+import bracket_store
+import calculate_tax_data
+import tax_cents
+
+# Differential check of the integer cents kernel. Every unique schedule is
+# evaluated on random incomes and on every bound and the cents either side
+# of it, and compared with
+#   - a plain Decimal loop over the brackets with rates in basis points,
+#     which must agree to the cent
+#   - the float functions in calculate_tax_data, which may only drift from
+#     the exact amount by less than TOLERANCE_CENTS. How often that drift
+#     changes the rounded cent is reported
+# Exits non-zero on any disagreement, and times both paths on a large batch.
+INCOMES_PER_SCHEDULE = 200
+TOLERANCE_CENTS = 1
+TIMING_INCOMES = 1_000_000
+BASIS_POINT = decimal.Decimal("0.0001")
+DECIMAL_ROUNDING = {"half_up": decimal.ROUND_HALF_UP, "half_even": decimal.ROUND_HALF_EVEN,
+                    "down": decimal.ROUND_DOWN, "up": decimal.ROUND_UP}
+
+
+def decimal_owed_cents(income_cents, schedule, rounding="half_up"):
+    # The slow reference: bracket by bracket in Decimal dollars
+    income = decimal.Decimal(int(income_cents)) / 100
+    owed = decimal.Decimal(0)
+    for low, high, rate in zip(schedule.bracket_low, schedule.bracket_high, schedule.bracket_rate):
+        low = decimal.Decimal(repr(float(low)))
+        rate = decimal.Decimal(repr(float(rate))).quantize(BASIS_POINT)
+        top = income if not np.isfinite(high) else min(income, decimal.Decimal(repr(float(high))))
+        if top > low:
+            owed += (top - low) * rate
+    return int((owed * 100).quantize(decimal.Decimal(1), rounding=DECIMAL_ROUNDING[rounding]))
+
+
+def get_test_incomes(schedule, random_state, count=INCOMES_PER_SCHEDULE):
+    bounds = tax_cents.dollars_to_cents(schedule.finite_bounds())
+    top = max(int(bounds.max()) * 2 if len(bounds) else 0, 100_000_000)
+    return np.unique(np.concatenate((
+        [0, 1], bounds - 1, bounds, bounds + 1,
+        random_state.integers(0, top, count),
+    )))
+
+
+def check_schedule(schedule, incomes, rounding):
+    # (disagreements, float drift in cents, incomes the float path rounds
+    # to another cent)
+    problems = []
+    exact = tax_cents.calculate_tax_owed_cents(incomes, schedule, rounding)
+    reference = np.array([decimal_owed_cents(income, schedule, rounding) for income in incomes])
+    wrong = np.flatnonzero(exact != reference)
+    if len(wrong):
+        problems.append(f"{len(wrong)} incomes differ from Decimal, e.g. {incomes[wrong[0]]} cents: "
+                        f"{exact[wrong[0]]} != {reference[wrong[0]]}")
+    if rounding != "half_up":
+        return problems, 0.0, 0
+    # The float paths against the exact amount before rounding, in cents
+    cents = tax_cents.get_cents_schedule(schedule)
+    unrounded = tax_cents.evaluate_cents(cents, incomes)[0] / tax_cents.RATE_SCALE
+    batch = calculate_tax_data.calculate_tax_batch(incomes / 100, schedule)
+    drift = np.abs(batch["owed"] * 100 - unrounded)
+    off_by_a_cent = int((np.floor(batch["owed"] * 100 + 0.5) != exact).sum())
+    sample = incomes[-1]
+    breakdown = calculate_tax_data.calculate_tax_breakdown_data(sample / 100, schedule)
+    drift = np.append(drift, abs(breakdown["bracket_owed"].sum() * 100 - unrounded[-1]))
+    cumulative = calculate_tax_data.calculate_cumulative_tax(sample / 100, schedule, interp=1,
+                                                             as_arrays=True)
+    points = tax_cents.calculate_cumulative_tax_cents(sample, schedule)["income"]
+    drift = np.append(drift, np.abs(cumulative["owed"] * 100 -
+                                    tax_cents.evaluate_cents(cents, points)[0] / tax_cents.RATE_SCALE))
+    if drift.max() >= TOLERANCE_CENTS:
+        problems.append(f"float path drifts {drift.max():.4f} cents")
+    return problems, float(drift.max()), off_by_a_cent
+
+
+def time_paths(schedule, count=TIMING_INCOMES, repeat=5, seed=0):
+    incomes = np.random.default_rng(seed).integers(0, 100_000_000, count)
+    dollars = incomes / 100
+    timings = {}
+    for name, function in (("float", lambda: calculate_tax_data.calculate_tax_owed(dollars, schedule)),
+                           ("cents", lambda: tax_cents.calculate_tax_owed_cents(incomes, schedule))):
+        function()
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        timings[name] = min(times)
+    return timings
+
+
+def run_checks(rounding_modes=tax_cents.ROUNDING, seed=0):
+    random_state = np.random.default_rng(seed)
+    store = bracket_store.load_packed_store()
+    schedules = {store.get(*key) for key in store.unique_keys()}
+    failures = 0
+    max_drift = 0.0
+    checked = 0
+    off_by_a_cent = 0
+    for schedule in sorted(schedules, key=lambda schedule: (-len(schedule), schedule.digest)):
+        incomes = get_test_incomes(schedule, random_state)
+        checked += len(incomes)
+        for rounding in rounding_modes:
+            problems, drift, off = check_schedule(schedule, incomes, rounding)
+            max_drift = max(max_drift, drift)
+            off_by_a_cent += off
+            for problem in problems:
+                failures += 1
+                print(f"{schedule!r} {rounding}: {problem}")
+    print(f"Checked {checked:,} incomes on {len(schedules)} schedules in {len(rounding_modes)} "
+          f"rounding modes, {failures} failures")
+    print(f"The float path drifts at most {max_drift:.2e} cents, and rounds "
+          f"{off_by_a_cent:,} incomes to a different cent")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the integer cents kernel against "
+                                                 "Decimal and the float path")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-timing", action="store_true")
+    args = parser.parse_args()
+    failures = run_checks(seed=args.seed)
+    if not args.no_timing:
+        store = bracket_store.load_packed_store()
+        schedule = max((store.get(*key) for key in store.unique_keys()), key=len)
+        timings = time_paths(schedule)
+        print(f"{TIMING_INCOMES:,} incomes on {schedule!r}: float {timings['float'] * 1000:.1f} ms, "
+              f"cents {timings['cents'] * 1000:.1f} ms")
+    sys.exit(1 if failures else 0)
@@ -3,123 +3,164 @@ import altair as alt
 import pprint as pp
 import numpy as np
 import calculate_tax_data
+from bracket_schedule import BracketSchedule
+
+# Above this many brackets, adjacent ones are drawn as one band so the number
+# of marks and labels stays the same however dense the schedule is. Up to it
+# every bracket is drawn on its own, in a color of its own from the scheme
+MAX_BANDS = 20
+BAND_COLOR_SCHEME = "tableau20"
+# A band's label is only drawn when the band spans this share of the y axis
+LABEL_SPACING = 0.04
+
+
+def get_bracket_bands(bracket_count, max_bands=MAX_BANDS):
+    # Band number of every bracket, contiguous runs of near equal size
+    brackets = np.arange(bracket_count)
+    if bracket_count <= max_bands:
+        return brackets
+    return brackets * max_bands // bracket_count
+
+
 class TaxBracketBreakdownGraph:
-    def __init__(self, tax_breakdown_data, user_income: int, tax_bracket_data: dict):
+    # Columns the layers read, everything else stays out of the payload
+    chart_columns = ["bracket_low", "bracket_rate", "bracket_owed",
+                     "cum_owed_low", "cum_owed_high"]
+
+    def __init__(self, tax_breakdown_data, user_income: int, tax_bracket_data,
+                 max_bands=MAX_BANDS):
+        schedule = BracketSchedule.coerce(tax_bracket_data)
         self.tax_breakdown_data = tax_breakdown_data
-        self.colorize_data()
-        self.set_axis_styles(user_income, tax_bracket_data)
-        income_chart = self.draw_income_graph(user_income)
-        bracket_chart = self.draw_bracket_graph(self.tax_breakdown_data)
-        total_owed_chart = self.draw_cumulative_obligation_graph(user_income, self.tax_breakdown_data)
-        gridline_layer = self.draw_gridlines(self.tax_breakdown_data)
+        # Layers read the income through a Vega expression, a constant here
+        self.income_expr = repr(float(user_income))
+        self.bands = get_bracket_bands(len(schedule), max_bands)
+        self.set_axis_styles(schedule)
+        self.draw_layers()
+
+
+    def draw_layers(self):
+        income_chart = self.draw_income_graph()
+        bracket_chart = self.draw_bracket_graph()
+        total_owed_chart = self.draw_cumulative_obligation_graph()
+        gridline_layer = self.draw_gridlines()
 
         # Order matters
         self.chart_assembly = [income_chart, gridline_layer, bracket_chart,
                                total_owed_chart]
 
 
-    def colorize_data(self):
-        # Colors from Sasha Trubetskoy
-        colors = ['#e6194b', '#3cb44b', '#ffe119', '#4363d8', '#f58231', '#911eb4', 
-                '#46f0f0', '#f032e6', '#bcf60c', '#fabebe', '#008080', '#e6beff', 
-                '#9a6324', '#fffac8', '#800000', '#aaffc3', '#808000', '#ffd8b1', 
-                '#000075', '#808080', '#ffffff', '#000000']
-        self.tax_breakdown_data['color'] = colors[0:len(self.tax_breakdown_data)]
-
-
-    def set_axis_styles(self, income: int, bracket_data: dict):
-        self.x_axis_def = alt.Axis(labelFontSize=14, labelAngle=0)
-        self.y_axis_def = alt.Axis(values=list(bracket_data.keys())[:-1]+[income],
-                                   format='$,.2f', labelOverlap="greedy",
-                                   labelFontSize=14)
+    def set_axis_styles(self, schedule: BracketSchedule):
+        # Layers share their axes, so the y axis is defined once on the first
+        # layer and the label style once in the chart config. Ticks mark the
+        # band edges and the income
+        self.axis_style = dict(labelFontSize=14, labelAngle=0)
+        band_edges = schedule.bracket_low[np.flatnonzero(np.diff(self.bands)) + 1]
+        tick_values = [repr(edge) for edge in band_edges.tolist()] + [self.income_expr]
+        self.y_axis_def = alt.Axis(values=alt.ExprRef(f"[{', '.join(tick_values)}]"),
+                                   format='$,.2f', labelOverlap="greedy")
     
 
-    def draw_income_graph(self, income: int):
-        # The only data needed is the income data point
-        income_data = pd.DataFrame({
-            "Income": [income],
-            "Name": "Income",
-        })
-        # Create the chart
-        income_chart = alt.Chart(income_data).transform_calculate(
-            display_text='toString(format(datum.Income, "$,.2f"))'
-        ).mark_bar(color='yellowgreen').encode(
-            x=alt.X("Name:N", axis=self.x_axis_def, title=""),
-            y=alt.Y("Income:Q", axis=self.y_axis_def, title=""),
-            tooltip=[alt.Tooltip('display_text:N', title="Income")]
-        )
+    def draw_income_graph(self):
+        income_chart = alt.Chart().mark_bar(color='yellowgreen')
         # Add descriptive text
-        income_text = income_chart.mark_text(
+        income_text = alt.Chart().mark_text(
             align='center', baseline='bottom', color='black', fontSize=14, dy=-2
         ).encode(
-            y=alt.Y('Income:Q', axis=self.y_axis_def), 
             text=alt.Text('Income:Q', format='$,.2f')
         )
-        income_chart_full = income_chart + income_text
+        # The income is a constant, collapse the shared data to one row for it
+        income_chart_full = alt.layer(income_chart, income_text).transform_aggregate(
+            rows='count()'
+        ).transform_calculate(
+            Income=self.income_expr,
+            Name='"Income"',
+            display_text='toString(format(datum.Income, "$,.2f"))'
+        ).encode(
+            x=alt.X("Name:N", title=""),
+            y=alt.Y("Income:Q", axis=self.y_axis_def, title=""),
+            tooltip=[alt.Tooltip('display_text:N', title="Income")]
+        )
         
         return income_chart_full
 
 
-    def draw_bracket_graph(self, tax_data):
-        # Create the chart with each bracket bar
-        liability_chart = alt.Chart(tax_data).transform_calculate(
-            label='"Owed Per Bracket"',
-            bracket_top_end_owed='datum.bracket_owed + datum.bracket_low'
-        ).mark_bar().encode(
-            x=alt.X('label:N', axis=self.x_axis_def),
-            y=alt.Y('bracket_low:Q', axis=self.y_axis_def, title=""),
+    def get_band_color(self):
+        return alt.Color('band:N', scale=alt.Scale(scheme=BAND_COLOR_SCHEME), legend=None)
+
+
+    def draw_bracket_graph(self):
+        # Create the chart with each band's bar
+        liability_chart = alt.Chart().mark_bar().encode(
+            y=alt.Y('bracket_low:Q', title=""),
             y2=alt.Y2("bracket_top_end_owed:Q"),
-            color=alt.Color('color', legend=None),
+            color=self.get_band_color(),
             tooltip=[alt.Tooltip('bracket_owed:Q', format='$,.2f', title="Owed")]
         )
-        # Label each bracket bar
-        text_equation = 'format(datum.bracket_rate, ".0%") + " (" + format(datum.bracket_owed, "$,.2f") + ")"'
-        liability_text = liability_chart.transform_calculate(
-            text = text_equation
+        # Label each band's bar, skipping bands too narrow to fit one
+        liability_text = alt.Chart().transform_window(
+            next_low='lead(bracket_low)',
+            sort=[alt.SortField("bracket_low")]
+        ).transform_filter(
+            f'(isValid(datum.next_low) ? datum.next_low : {self.income_expr}) - datum.bracket_low'
+            f' >= {LABEL_SPACING} * {self.income_expr}'
         ).mark_text(
             align='center', baseline='bottom', fontSize=14, dy=-2
         ).encode(
-            y=alt.Y('bracket_top_end_owed:Q', axis=self.y_axis_def, title=""),
+            y=alt.Y('bracket_top_end_owed:Q', title=""),
             color=alt.value('black'),
             text=alt.Text("text:N"),
-            tooltip=[alt.Tooltip('bracket_rate:Q', format='.0%', title="Bracket Tax Rate")]
+            tooltip=[alt.Tooltip('rate_text:N', title="Bracket Tax Rate")]
         )
         # Create underlay for the descriptive text for visual clarity
         liability_text_underlay = liability_text.mark_text(
             align='center', baseline='bottom', fontSize=14,
             stroke='white', strokeWidth=5, strokeJoin='round', dy=-2
         )
-        return  liability_text_underlay + liability_chart + liability_text
+        # The three layers share their transforms and x encoding. A band
+        # covering several rates is labelled with their range
+        rate_equation = ('datum.rate_low == datum.rate_high ? format(datum.rate_low, ".0%") : ' +
+                         'format(datum.rate_low, ".0%") + "-" + format(datum.rate_high, ".0%")')
+        text_equation = 'datum.rate_text + " (" + format(datum.bracket_owed, "$,.2f") + ")"'
+        return alt.layer(
+            liability_text_underlay, liability_chart, liability_text
+        ).transform_calculate(
+            label='"Owed Per Bracket"',
+            bracket_top_end_owed='datum.bracket_owed + datum.bracket_low',
+            rate_text=rate_equation
+        ).transform_calculate(
+            text=text_equation
+        ).encode(
+            x=alt.X('label:N')
+        )
     
 
-    def draw_cumulative_obligation_graph(self, income, tax_data):
-        # Create the chart with each bracket bar
-        cumulative_liability_chart = alt.Chart(tax_data).transform_calculate(
+    def draw_cumulative_obligation_graph(self):
+        # Create the chart with each band's bar
+        cumulative_liability_chart = alt.Chart().transform_calculate(
             label='"Total Owed"'
         ).mark_bar().encode(
-            x=alt.X("label:N", axis=self.x_axis_def, title=""),
-            y=alt.Y("cum_owed_low:Q", axis=self.y_axis_def, title=""),
+            x=alt.X("label:N", title=""),
+            y=alt.Y("cum_owed_low:Q", title=""),
             y2=alt.Y2("cum_owed_high:Q"),
-            color=alt.Color('color', legend=None),
+            color=self.get_band_color(),
             tooltip=[alt.Tooltip('max(cum_owed_high):Q', format='$,.2f', title="Total Owed")]
         )
         # Label the total obligation
         text_equation = 'format(datum.cum_owed_high, "$,.2f") + " (" + format(datum.effective_rate, ".1%") + ")"'
-        cumulative_liability_text = alt.Chart(tax_data).transform_window(
+        cumulative_liability_text = alt.Chart().transform_window(
             sort=[alt.SortField("cum_owed_high", order="descending")],
             rank="rank(cum_owed_high)"
         ).transform_filter(
             alt.datum.rank == 1 # Only mark on the maximum value
         ).transform_calculate(
             label='"Total Owed"',
-            income=alt.expr.toString(income),
-            effective_rate=f'datum.cum_owed_high / datum.income',
+            effective_rate=f'datum.cum_owed_high / {self.income_expr}',
             text = text_equation
         ).mark_text(
             align='center', baseline='bottom', fontSize=14, dy=-2
         ).encode(
-            x=alt.X('label:N', axis=self.x_axis_def, title=""),
-            y=alt.Y('cum_owed_high:Q', axis=self.y_axis_def, title=""),
+            x=alt.X('label:N', title=""),
+            y=alt.Y('cum_owed_high:Q', title=""),
             text=alt.Text('text:N'),
             tooltip=[alt.Tooltip('max(cum_owed_high):Q', format='$,.2f', title="Total Owed"),
                      alt.Tooltip('max(effective_rate):Q', format='.1%', title="Effective Tax Rate")]
@@ -134,8 +175,8 @@ class TaxBracketBreakdownGraph:
         return cumulative_liability_underlay + cumulative_liability_chart + cumulative_liability_text
     
 
-    def draw_gridlines(self, tax_data):
-        gridlines = alt.Chart(tax_data).mark_rule(
+    def draw_gridlines(self):
+        gridlines = alt.Chart().mark_rule(
             color='darkslategray', strokeDash=[2,2]
         ).encode(
             y=alt.Y('bracket_low:Q')
@@ -143,9 +184,78 @@ class TaxBracketBreakdownGraph:
         return gridlines
     
 
+    def band_brackets(self, chart):
+        # One row per band: where it starts, its range of rates and what is
+        # owed in it. With fewer brackets than bands each band is one bracket
+        return chart.transform_aggregate(
+            bracket_low='min(bracket_low)',
+            rate_low='min(bracket_rate)',
+            rate_high='max(bracket_rate)',
+            bracket_owed='sum(bracket_owed)',
+            cum_owed_low='min(cum_owed_low)',
+            cum_owed_high='max(cum_owed_high)',
+            groupby=['band']
+        )
+
+
+    def get_chart_data(self):
+        data = self.tax_breakdown_data[self.chart_columns].copy()
+        data['band'] = self.bands[:len(data)]
+        return data
+
+
     def get_full_combochart(self):
-        return alt.layer(*self.chart_assembly)
+        # Every layer reads the one dataset attached at the top
+        chart = alt.layer(*self.chart_assembly, data=self.get_chart_data())
+        return self.band_brackets(chart).configure_axis(
+            **self.axis_style
+        )
     
+
+class TaxBracketInteractiveGraph(TaxBracketBreakdownGraph):
+    # The breakdown chart with income as a Vega-Lite parameter. The whole
+    # schedule is embedded and everything that depends on income is done by
+    # transforms in the browser, so changing it never reaches the server
+    def __init__(self, tax_bracket_data, user_income=0, max_bands=MAX_BANDS):
+        schedule = BracketSchedule.coerce(tax_bracket_data)
+        self.income = alt.param(name="income", value=user_income,
+                                bind=alt.binding(input="number", name="Income "))
+        self.income_expr = "income"
+        self.bands = get_bracket_bands(len(schedule), max_bands)
+        self.data = self.calculate_data(schedule)
+        self.set_axis_styles(schedule)
+        self.draw_layers()
+
+    def calculate_data(self, schedule: BracketSchedule):
+        # The open top bracket has no upper bound, it is sent as null
+        return pd.DataFrame({
+            "bracket_low": schedule.bracket_low,
+            "bracket_high": np.where(np.isinf(schedule.bracket_high), np.nan,
+                                     schedule.bracket_high),
+            "bracket_rate": schedule.bracket_rate,
+            "cum_owed_low": schedule.cum_owed_low,
+            "band": self.bands,
+        })
+
+    def get_full_combochart(self):
+        chart = alt.layer(*self.chart_assembly, data=self.data).add_params(
+            self.income
+        )
+        # Brackets the income reaches, and what is owed in each
+        chart = chart.transform_filter(
+            'datum.bracket_low < income'
+        ).transform_calculate(
+            bracket_top='isValid(datum.bracket_high) ? min(datum.bracket_high, income) : income'
+        ).transform_calculate(
+            bracket_owed='(datum.bracket_top - datum.bracket_low) * datum.bracket_rate'
+        ).transform_calculate(
+            cum_owed_high='datum.cum_owed_low + datum.bracket_owed'
+        )
+        return self.band_brackets(chart).configure_axis(
+            **self.axis_style
+        )
+
+
 class TaxBracketStepGraph:
     def __init__(self, brackets, buffer=1.2) -> None:
         data = self.calculate_data(brackets, buffer)
@@ -153,11 +263,10 @@ class TaxBracketStepGraph:
         self.draw_bracket_step_graph(data)
 
     def calculate_data(self, brackets, buffer):
-        brackets_c = np.array(list(brackets.keys()))
-        brackets_c = brackets_c.astype(int)
-        buffered_income = brackets_c[np.isfinite(brackets_c)].max() * buffer
+        schedule = BracketSchedule.coerce(brackets)
+        buffered_income = schedule.top_finite_bound * buffer
         data = calculate_tax_data.calculate_tax_breakdown_data(buffered_income, 
-                                                               brackets)
+                                                               schedule)
         return data
     
     def set_axis_styles(self, data):
@@ -184,11 +293,10 @@ class TaxOwedGraph:
         self.draw_tax_owed_graph(data)
 
     def calculate_data(self, brackets, buffer):
-        brackets_c = np.array(list(brackets.keys()))
-        brackets_c = brackets_c.astype(int)
-        buffered_income = brackets_c[np.isfinite(brackets_c)].max() * buffer
+        schedule = BracketSchedule.coerce(brackets)
+        buffered_income = schedule.top_finite_bound * buffer
         data = calculate_tax_data.calculate_cumulative_tax(buffered_income, 
-                                                           brackets)
+                                                           schedule)
         return data
 
     def set_axis_styles(self):
@@ -208,4 +316,44 @@ class TaxOwedGraph:
         self.chart = alt.layer(chart + point_chart)
 
     def get_chart(self):
-        return self.chart
\ No newline at end of file
+        return self.chart
+
+
+class TaxHistoryGraph:
+    def __init__(self, history_data, measure="effective_rate") -> None:
+        data = self.calculate_data(history_data)
+        self.set_axis_styles(measure)
+        self.draw_history_graph(data, measure)
+
+    def calculate_data(self, history_data):
+        # Years such as "1940(A)" plot at their calendar year
+        data = history_data.copy()
+        data["year_number"] = data["year"].str[:4].astype(int)
+        return data
+
+    def set_axis_styles(self, measure):
+        self.x_axis_def = alt.Axis(labelFontSize=14, format='d')
+        if measure == "owed":
+            self.y_axis_def = alt.Axis(labelFontSize=14, format='$,.2f')
+        else:
+            self.y_axis_def = alt.Axis(labelFontSize=14, format='%')
+
+    def draw_history_graph(self, data, measure):
+        titles = {"owed": "Owed", "effective_rate": "Effective Tax Rate",
+                  "marginal_rate": "Marginal Tax Rate"}
+        formats = {"owed": '$,.2f', "effective_rate": '.1%', "marginal_rate": '.1%'}
+        self.chart = alt.Chart(data).mark_line(interpolate='step-after').encode(
+            x=alt.X('year_number:Q', axis=self.x_axis_def, title="Year",
+                    scale=alt.Scale(zero=False)),
+            y=alt.Y(f'{measure}:Q', axis=self.y_axis_def, title=titles[measure]),
+            color=alt.Color('filer:N', title="Filing Status",
+                            legend=alt.Legend(orient='bottom')),
+            tooltip=[alt.Tooltip('year:N', title="Year"),
+                     alt.Tooltip('filer:N', title="Filing Status"),
+                     alt.Tooltip('owed:Q', format='$,.2f', title="Owed"),
+                     alt.Tooltip(f'{measure}:Q', format=formats[measure],
+                                 title=titles[measure])]
+        )
+
+    def get_chart(self):
+        return self.chart
@@ -0,0 +1,63 @@
+import argparse
+import ast
+import json
+import subprocess
+import sys
+
+# Cold import cost of the app's modules, each measured in a fresh
+# interpreter so nothing is already loaded. "first paint" imports what
+# streamlit_main.py imports at module level, read from its source so the
+# report follows the app.
+APP_PATH = "streamlit_main.py"
+MODULES = ["streamlit", "numpy", "pandas", "altair", "requests", "st_copy_to_clipboard",
+           "bracket_schedule", "bracket_store", "calculate_tax_data", "remote_data",
+           "chart_cache", "schedule_matrix", "create_graph"]
+HEAVY_MODULES = ["pandas", "altair", "requests", "st_copy_to_clipboard"]
+TIMING_CODE = """
+import json, sys, time
+start = time.perf_counter()
+for name in sys.argv[1:]:
+    __import__(name)
+elapsed = time.perf_counter() - start
+print(json.dumps({"ms": elapsed * 1000,
+                  "loaded": [name for name in %r if name in sys.modules]}))
+"""
+
+
+def get_eager_imports(app_path=APP_PATH):
+    # Top level modules imported by the app before any of its code runs
+    with open(app_path) as file:
+        tree = ast.parse(file.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return modules
+
+
+def time_import(modules, repeat=3):
+    # Fastest of several cold starts, and which heavy modules came along
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", TIMING_CODE % HEAVY_MODULES, *modules],
+                                capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return min(run["ms"] for run in runs), runs[0]["loaded"]
+
+
+def print_import_report(repeat=3):
+    print(f"{'module':<24}{'cold ms':>9}  heavy modules loaded")
+    for module in MODULES:
+        elapsed, loaded = time_import([module], repeat)
+        print(f"{module:<24}{elapsed:>9.0f}  {', '.join(loaded)}")
+    elapsed, loaded = time_import(get_eager_imports(), repeat)
+    print(f"{'first paint':<24}{elapsed:>9.0f}  {', '.join(loaded)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report cold import times of the app's modules")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print_import_report(args.repeat)
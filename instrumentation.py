@@ -0,0 +1,145 @@
+import collections
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+
+# Per-stage wall time, cache hit or miss and peak allocations, logged as one
+# JSON line per stage and kept in rolling windows for the debug panel.
+# Set INSTRUMENTATION=timing for wall time only, or INSTRUMENTATION=memory to
+# also trace allocations (tracemalloc slows every allocation down, so it is
+# opt in). Off by default, stage() then hands back a shared no-op context.
+MODE = os.environ.get("INSTRUMENTATION", "off").lower()
+ENABLED = MODE in ("timing", "memory")
+TRACE_MEMORY = MODE == "memory"
+WINDOW = 200
+
+logger = logging.getLogger("tax_app.stages")
+_null_stage = contextlib.nullcontext()
+_local = threading.local()
+_lock = threading.Lock()
+_windows = collections.defaultdict(lambda: collections.deque(maxlen=WINDOW))
+
+
+class Stage:
+    def __init__(self, name, cached=False):
+        self.name = name
+        self.cached = cached
+        self.cache_miss = False
+
+    def __enter__(self):
+        stack = get_stack()
+        if TRACE_MEMORY:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            # The enclosing stage keeps the highest peak seen before this one
+            # resets it
+            if stack:
+                stack[-1].max_traced = max(stack[-1].max_traced, peak)
+            tracemalloc.reset_peak()
+            self.start_traced = current
+            self.max_traced = current
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        stack = get_stack()
+        stack.pop()
+        record = {"stage": self.name, "ms": round(elapsed * 1000, 3)}
+        if self.cached:
+            record["cache"] = "miss" if self.cache_miss else "hit"
+        if TRACE_MEMORY:
+            self.max_traced = max(self.max_traced, tracemalloc.get_traced_memory()[1])
+            record["peak_kb"] = round((self.max_traced - self.start_traced) / 1024, 1)
+            if stack:
+                stack[-1].max_traced = max(stack[-1].max_traced, self.max_traced)
+        if exc_info[0] is not None:
+            record["error"] = exc_info[0].__name__
+        add_record(record)
+        return False
+
+
+def get_stack():
+    # Stages nest per thread, every Streamlit session runs on its own thread.
+    # tracemalloc is process wide, concurrent sessions share its peaks
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def stage(name, cached=False):
+    # with stage("calculate"): ..., cached=True reports a hit unless the
+    # cached function's body calls record_cache_miss()
+    if not ENABLED:
+        return _null_stage
+    return Stage(name, cached)
+
+
+def timed_stage(name=None, cached=False):
+    # Decorator form of stage(), named after the function by default
+    def decorator(function):
+        stage_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name, cached):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_cache_miss():
+    # Called from inside a cached function, its body only runs on a miss
+    if not ENABLED:
+        return
+    stack = get_stack()
+    if stack:
+        stack[-1].cache_miss = True
+
+
+def add_record(record):
+    with _lock:
+        _windows[record["stage"]].append(record)
+    logger.info(json.dumps(record))
+
+
+def summarize():
+    # Rolling aggregates over the last WINDOW records of every stage
+    with _lock:
+        windows = {name: list(records) for name, records in _windows.items()}
+    rows = []
+    for name, records in windows.items():
+        times = sorted(record["ms"] for record in records)
+        row = {"stage": name, "count": len(records),
+               "mean ms": round(sum(times) / len(times), 3),
+               "p95 ms": times[min(len(times) - 1, int(len(times) * 0.95))],
+               "max ms": times[-1]}
+        cached = [record["cache"] for record in records if "cache" in record]
+        if cached:
+            row["hit rate"] = round(cached.count("hit") / len(cached), 3)
+        peaks = [record["peak_kb"] for record in records if "peak_kb" in record]
+        if peaks:
+            row["max peak kb"] = max(peaks)
+        rows.append(row)
+    return rows
+
+
+def reset():
+    with _lock:
+        _windows.clear()
+
+
+if ENABLED and not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
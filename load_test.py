@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import socket
+import subprocess
+import sys
+import time
+import numpy as np
+import bracket_store
+
+# Drives tax_api.py with many keep-alive connections posting breakdown
+# batches for random (year, filer, income) items, and reports throughput and
+# latency. Without --port it starts a local service on a free port first.
+# Load is generated from several processes so the client is not the limit.
+DURATION = 10
+CONNECTIONS = 64
+BATCH_SIZE = 1
+COUNTRY = "United States"
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def build_bodies(batch_size, count=256, seed=0):
+    # Pre-encoded request bodies spread over every schedule and a wide range
+    # of incomes, so encoding never shows up in the timings
+    store = bracket_store.load_packed_store()
+    keys = [key for key in store.keys() if key[0] == COUNTRY]
+    random_state = random.Random(seed)
+    bodies = []
+    for _ in range(count):
+        items = []
+        for _ in range(batch_size):
+            _, year, filer = random_state.choice(keys)
+            items.append({"year": year, "filer": filer,
+                          "income": round(10 ** random_state.uniform(3, 6.5), 2)})
+        bodies.append(json.dumps({"items": items}).encode())
+    return bodies
+
+
+def encode_request(host, port, body):
+    return (f"POST /breakdown HTTP/1.1\r\nHost: {host}:{port}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+            ).encode("latin-1") + body
+
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def run_connection(host, port, requests, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        i = random.randrange(len(requests))
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            writer.write(requests[i % len(requests)])
+            status = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+            i += 1
+    finally:
+        writer.close()
+
+
+async def run_client(host, port, connections, duration, batch_size, seed):
+    requests = [encode_request(host, port, body) for body in build_bodies(batch_size, seed=seed)]
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*[run_connection(host, port, requests, deadline, latencies, errors)
+                           for _ in range(connections)])
+    return latencies, len(errors)
+
+
+def client_process(arguments):
+    return asyncio.run(run_client(*arguments))
+
+
+def wait_for_service(host, port, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"The service did not start on {host}:{port}")
+
+
+def run_load_test(host, port, connections=CONNECTIONS, duration=DURATION,
+                  batch_size=BATCH_SIZE, clients=None):
+    clients = clients or max(1, min(multiprocessing.cpu_count() // 2, connections))
+    # Connections are split across the client processes
+    shares = [connections // clients + (i < connections % clients) for i in range(clients)]
+    arguments = [(host, port, share, duration, batch_size, seed)
+                 for seed, share in enumerate(shares) if share]
+    with multiprocessing.Pool(len(arguments)) as pool:
+        results = pool.map(client_process, arguments)
+    latencies = np.concatenate([np.array(latencies) for latencies, _ in results])
+    errors = sum(errors for _, errors in results)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": len(latencies) / duration,
+        "items_per_second": len(latencies) * batch_size / duration,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+    }
+
+
+def print_report(report):
+    print(f"Requests: {report['requests']:,} ({report['errors']:,} errors)")
+    print(f"{report['requests_per_second']:,.0f} requests per second, "
+          f"{report['items_per_second']:,.0f} items per second")
+    print(f"Latency p50 {report['p50_ms']:.2f} ms, p95 {report['p95_ms']:.2f} ms, "
+          f"p99 {report['p99_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the tax JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="Test a running service instead of starting one")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count() // 2 or 1,
+                        help="Workers of the service started for the test")
+    parser.add_argument("--connections", type=int, default=CONNECTIONS)
+    parser.add_argument("--duration", type=float, default=DURATION)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="Items in each request")
+    parser.add_argument("--clients", type=int, help="Client processes generating load")
+    args = parser.parse_args()
+    service = None
+    port = args.port
+    if port is None:
+        port = get_free_port()
+        service = subprocess.Popen([sys.executable, "tax_api.py", "--host", args.host,
+                                    "--port", str(port), "--workers", str(args.workers)])
+    try:
+        wait_for_service(args.host, port)
+        print_report(run_load_test(args.host, port, args.connections, args.duration,
+                                   args.batch_size, args.clients))
+    finally:
+        if service is not None:
+            service.terminate()
+            service.wait()
@@ -0,0 +1,217 @@
+import argparse
+import collections
+import sys
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+import bracket_store
+import calculate_tax_data
+
+# Streams a file of filer records through the batch tax engine. Records are
+# read in fixed size chunks and only a bounded number of chunks are in
+# flight, so memory stays flat however large the input is.
+CHUNK_SIZE = 100_000
+DEFAULT_COUNTRY = "United States"
+# Effective rates are binned to 0.01 percentage points for the deciles
+RATE_BINS = 10_000
+DECILES = np.arange(1, 10) / 10
+
+_schedules = None
+
+
+def init_worker(source_path, packed_path):
+    global _schedules
+    _schedules = bracket_store.load_schedules(source_path, packed_path)
+
+
+def read_chunks(source, chunk_size=CHUNK_SIZE, input_format=None):
+    # Chunks of records from a path or an open file in one of
+    # batch_calculator.FORMATS. Without a format, .parquet files are parquet
+    # and anything else csv
+    if input_format is None:
+        input_format = "parquet" if str(source).endswith(".parquet") else "csv"
+    if input_format == "csv":
+        yield from pd.read_csv(source, chunksize=chunk_size, dtype={"year": str})
+    elif input_format == "jsonl":
+        yield from pd.read_json(source, lines=True, chunksize=chunk_size, dtype={"year": str})
+    else:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError(f"Reading {input_format} requires pyarrow")
+        if input_format == "parquet":
+            # Parquet keeps its index at the end of the file, it can't be piped in
+            if source is sys.stdin.buffer:
+                raise ValueError("Parquet input has to be a file")
+            for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+                yield batch.to_pandas()
+        else:
+            for batch in pa.ipc.open_stream(source):
+                yield batch.to_pandas()
+
+
+def prepare_chunk(chunk: pd.DataFrame):
+    # (chunk, incomes) with a country on every record and years as strings.
+    # Blank or non-numeric incomes are NaN
+    chunk = chunk.reset_index(drop=True)
+    if "country" not in chunk:
+        chunk["country"] = DEFAULT_COUNTRY
+    chunk["year"] = chunk["year"].astype(str)
+    return chunk, pd.to_numeric(chunk["income"], errors="coerce").to_numpy(float)
+
+
+def group_records(chunk: pd.DataFrame, valid, schedules):
+    # (key, rows, schedule) of the valid records of each schedule, so each
+    # schedule is applied once per chunk. Records without one are left out
+    valid_rows = np.flatnonzero(valid)
+    groups = chunk.iloc[valid_rows].groupby(["country", "year", "filer"], sort=False).indices
+    for key, positions in groups.items():
+        schedule = schedules.get(key)
+        if schedule is not None:
+            yield key, valid_rows[positions], schedule
+
+
+def simulate_chunk(chunk: pd.DataFrame, keep_records=False):
+    chunk, incomes = prepare_chunk(chunk)
+    valid = np.isfinite(incomes)
+    weights = chunk["weight"].to_numpy(float) if "weight" in chunk else np.ones(len(chunk))
+    owed = np.full(len(chunk), np.nan)
+    effective_rate = np.full(len(chunk), np.nan)
+    marginal_rate = np.full(len(chunk), np.nan)
+    bracket_revenue = {}
+    for key, rows, schedule in group_records(chunk, valid, _schedules):
+        batch = calculate_tax_data.calculate_tax_batch(incomes[rows], schedule)
+        owed[rows] = batch["owed"]
+        effective_rate[rows] = batch["effective_rate"]
+        marginal_rate[rows] = batch["marginal_rate"]
+        bracket_revenue[key] = weights[rows] @ batch["bracket_owed"]
+    matched = ~np.isnan(owed)
+    rate_bins = np.clip((effective_rate[matched] * RATE_BINS).astype(int), 0, RATE_BINS)
+    totals = {
+        "records": len(chunk),
+        "invalid": int((~valid).sum()),
+        "unmatched": int((valid & ~matched).sum()),
+        "total_income": float(weights[matched] @ incomes[matched]),
+        "total_owed": float(weights[matched] @ owed[matched]),
+        "rate_histogram": np.bincount(rate_bins, weights=weights[matched],
+                                      minlength=RATE_BINS + 1),
+        "bracket_revenue": bracket_revenue,
+    }
+    records = None
+    if keep_records:
+        records = chunk.assign(owed=owed, effective_rate=effective_rate,
+                               marginal_rate=marginal_rate)
+    return totals, records
+
+
+class SimulationResult:
+    def __init__(self):
+        self.records = 0
+        self.invalid = 0
+        self.unmatched = 0
+        self.total_income = 0.0
+        self.total_owed = 0.0
+        self.rate_histogram = np.zeros(RATE_BINS + 1)
+        self.bracket_revenue = {}
+
+    def add(self, totals):
+        self.records += totals["records"]
+        self.invalid += totals["invalid"]
+        self.unmatched += totals["unmatched"]
+        self.total_income += totals["total_income"]
+        self.total_owed += totals["total_owed"]
+        self.rate_histogram += totals["rate_histogram"]
+        for key, revenue in totals["bracket_revenue"].items():
+            if key in self.bracket_revenue:
+                self.bracket_revenue[key] = self.bracket_revenue[key] + revenue
+            else:
+                self.bracket_revenue[key] = revenue
+
+    def effective_rate_deciles(self):
+        cumulative = np.cumsum(self.rate_histogram)
+        if cumulative[-1] == 0:
+            return np.full(len(DECILES), np.nan)
+        bins = np.searchsorted(cumulative, DECILES * cumulative[-1], side="left")
+        return bins / RATE_BINS
+
+    def bracket_revenue_frame(self, schedules):
+        rows = []
+        for (country, year, filer), revenue in self.bracket_revenue.items():
+            schedule = schedules[(country, year, filer)]
+            for i, owed in enumerate(revenue):
+                rows.append([country, year, filer, schedule.bracket_low[i],
+                             schedule.bracket_high[i], schedule.bracket_rate[i], owed])
+        return pd.DataFrame(rows, columns=["country", "year", "filer", "bracket_low",
+                                           "bracket_high", "bracket_rate", "revenue"])
+
+
+def run_microsimulation(input_path, output_path=None, workers=None,
+                        chunk_size=CHUNK_SIZE, source_path=bracket_store.SOURCE_PATH,
+                        packed_path=bracket_store.PACKED_STORE_PATH):
+    result = SimulationResult()
+    keep_records = output_path is not None
+    write_header = True
+
+    def collect(totals, records):
+        nonlocal write_header
+        result.add(totals)
+        if keep_records:
+            records.to_csv(output_path, mode="w" if write_header else "a",
+                           header=write_header, index=False)
+            write_header = False
+
+    chunks = read_chunks(input_path, chunk_size)
+    if workers is not None and workers > 1:
+        # At most two chunks per worker are queued, results come back in input order
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(source_path, packed_path)) as pool:
+            in_flight = collections.deque()
+            for chunk in chunks:
+                in_flight.append(pool.submit(simulate_chunk, chunk, keep_records))
+                if len(in_flight) >= 2 * workers:
+                    collect(*in_flight.popleft().result())
+            while in_flight:
+                collect(*in_flight.popleft().result())
+    else:
+        init_worker(source_path, packed_path)
+        for chunk in chunks:
+            collect(*simulate_chunk(chunk, keep_records))
+    return result
+
+
+def print_report(result: SimulationResult, schedules, elapsed):
+    print(f"Records: {result.records:,} ({result.unmatched:,} without a schedule, "
+          f"{result.invalid:,} without a valid income)")
+    print(f"Total income: ${result.total_income:,.2f}")
+    print(f"Total owed: ${result.total_owed:,.2f}")
+    if result.total_income > 0:
+        print(f"Average effective rate: {result.total_owed / result.total_income:.2%}")
+    deciles = ", ".join(f"{rate:.2%}" for rate in result.effective_rate_deciles())
+    print(f"Effective rate deciles: {deciles}")
+    revenue = result.bracket_revenue_frame(schedules)
+    by_rate = revenue.groupby("bracket_rate")["revenue"].sum()
+    print("Revenue by bracket rate:")
+    for rate, owed in by_rate[by_rate > 0].items():
+        print(f"  {rate:>7.2%}  ${owed:,.2f}")
+    print(f"{result.records / elapsed:,.0f} records per second")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="""Estimate revenue over a file of filer
+                                     records with income, year, filer and optional
+                                     country and weight columns""")
+    parser.add_argument("input", help="CSV or Parquet file of records")
+    parser.add_argument("--output", help="Write every record with its result to this CSV")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--bracket-revenue", help="Write per-bracket revenue to this CSV")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    result = run_microsimulation(args.input, args.output, args.workers, args.chunk_size)
+    elapsed = time.perf_counter() - start
+    schedules = bracket_store.load_schedules()
+    print_report(result, schedules, elapsed)
+    if args.bracket_revenue:
+        result.bracket_revenue_frame(schedules).to_csv(args.bracket_revenue, index=False)
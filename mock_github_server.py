@@ -0,0 +1,136 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# A local stand-in for the parts of the GitHub API the app uses, serving
+# bracket-data-store/ from disk. Point the app at it with
+#   GITHUB_API_URL=http://localhost:8765 GITHUB_RAW_URL=http://localhost:8765/raw
+# SHAs follow git's blob hashing, trees hash their children, so editing a
+# file changes its blob SHA and every tree above it like on GitHub.
+STORE_PATH = "bracket-data-store"
+
+
+def git_blob_sha(data: bytes):
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def build_tree(root, store_path=STORE_PATH):
+    # Returns (tree SHA, recursive tree listing) for the store directory
+    store_root = os.path.join(root, store_path)
+    nodes = []
+    tree_contents = {"": []}
+    for directory, subdirectories, files in os.walk(store_root):
+        subdirectories.sort()
+        relative = os.path.relpath(directory, store_root).replace(os.sep, "/")
+        relative = "" if relative == "." else relative
+        for name in subdirectories:
+            path = f"{relative}/{name}" if relative else name
+            nodes.append({"path": path, "type": "tree"})
+            tree_contents[path] = []
+        for name in sorted(files):
+            path = f"{relative}/{name}" if relative else name
+            with open(os.path.join(directory, name), "rb") as file:
+                sha = git_blob_sha(file.read())
+            nodes.append({"path": path, "type": "blob", "sha": sha})
+            tree_contents[relative].append(f"{name}:{sha}")
+    # Hash trees bottom up so a change anywhere reaches the root SHA
+    tree_shas = {}
+    for path in sorted(tree_contents, key=lambda path: -path.count("/") - (path != "")):
+        children = list(tree_contents[path])
+        prefix = f"{path}/" if path else ""
+        for child, sha in tree_shas.items():
+            if child.startswith(prefix) and "/" not in child[len(prefix):] and child != path:
+                children.append(f"{child}:{sha}")
+        tree_shas[path] = hashlib.sha1("\n".join(sorted(children)).encode()).hexdigest()
+    for node in nodes:
+        if node["type"] == "tree":
+            node["sha"] = tree_shas[node["path"]]
+    return tree_shas[""], nodes
+
+
+class MockGitHubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            failures = server.failures_left
+            if failures > 0:
+                server.failures_left -= 1
+        if failures > 0:
+            # Simulate GitHub's secondary rate limit
+            return self.send_json({"message": "rate limited"}, status=429,
+                                  headers={"Retry-After": "0"})
+        url = urllib.parse.urlparse(self.path)
+        parts = [urllib.parse.unquote(part) for part in url.path.split("/") if part]
+        # /repos/{owner}/{repo}/contents
+        if parts[:1] == ["repos"] and parts[3:] == ["contents"]:
+            tree_sha, _ = build_tree(server.root)
+            return self.send_json([{"name": STORE_PATH, "type": "dir", "sha": tree_sha}])
+        # /repos/{owner}/{repo}/git/trees/{sha}
+        if parts[:1] == ["repos"] and parts[3:5] == ["git", "trees"]:
+            tree_sha, nodes = build_tree(server.root)
+            base = f"http://{self.headers['Host']}/repos/{parts[1]}/{parts[2]}/git"
+            for node in nodes:
+                node["url"] = f"{base}/{node['type']}s/{node['sha']}"
+            return self.send_json({"sha": tree_sha, "tree": nodes, "truncated": False})
+        # /raw/{owner}/{repo}/refs/heads/main/{path}
+        if parts[:1] == ["raw"] and parts[3:6] == ["refs", "heads", "main"]:
+            file_path = os.path.join(server.root, *parts[6:])
+            if os.path.isfile(file_path):
+                with open(file_path, "rb") as file:
+                    return self.send_body(file.read(), "text/plain")
+        return self.send_json({"message": "Not Found"}, status=404)
+
+    def send_json(self, payload, status=200, headers=None):
+        self.send_body(json.dumps(payload).encode("utf-8"), "application/json",
+                       status, headers)
+
+    def send_body(self, body, content_type, status=200, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def start_server(root=".", port=0, failures=0, verbose=False):
+    # Runs in a background thread, port 0 picks a free port.
+    # failures answers that many requests with 429 before serving normally
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockGitHubHandler)
+    server.root = root
+    server.verbose = verbose
+    server.lock = threading.Lock()
+    server.request_count = 0
+    server.failures_left = failures
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def server_urls(server):
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    return base, f"{base}/raw"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve bracket-data-store like the GitHub API")
+    parser.add_argument("--root", default=".")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    server = start_server(args.root, args.port, verbose=True)
+    api_url, raw_url = server_urls(server)
+    print(f"GITHUB_API_URL={api_url} GITHUB_RAW_URL={raw_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,242 @@
+import json
+import os
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+
+# Base URLs can be pointed at mock_github_server.py to work offline
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com")
+GITHUB_RAW_URL = os.environ.get("GITHUB_RAW_URL", "https://raw.githubusercontent.com")
+CACHE_PATH = os.environ.get("BRACKET_CACHE_DIR", ".cache/bracket-data")
+CACHE_MAX_BYTES = 16 * 1024 * 1024
+LATEST_TREE_KEY = "tree-latest"
+PREFETCH_WORKERS = 8
+MAX_RETRIES = 4
+BACKOFF_SECONDS = 0.5
+MAX_WAIT_SECONDS = 60
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class DiskCache:
+    # Files named by key, a file's mtime doubles as its last access time so
+    # eviction drops the least recently used entries first
+    def __init__(self, directory=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self.path_for(key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return data
+
+    def write(self, key, data: bytes):
+        path = self.path_for(key)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(data)
+        os.replace(temporary_path, path)
+
+    def set(self, key, data: bytes):
+        self.write(key, data)
+        self.evict()
+
+    def set_many(self, items: dict):
+        # Batch writes pay for a single eviction pass
+        for key, data in items.items():
+            self.write(key, data)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+
+def get_disk_cache():
+    return DiskCache(CACHE_PATH, CACHE_MAX_BYTES)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    # One pooled session so connections are kept alive and reused
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=PREFETCH_WORKERS,
+                                  pool_maxsize=PREFETCH_WORKERS)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def get_retry_wait(response, attempt):
+    # Honour GitHub's rate limit headers, otherwise back off exponentially
+    wait = BACKOFF_SECONDS * 2 ** attempt
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if retry_after is not None:
+            wait = float(retry_after)
+        elif response.headers.get("X-RateLimit-Remaining") == "0" and reset is not None:
+            wait = float(reset) - time.time()
+    return min(max(wait, 0), MAX_WAIT_SECONDS)
+
+
+def is_rate_limited(response):
+    return (response.status_code == 403 and
+            response.headers.get("X-RateLimit-Remaining") == "0")
+
+
+def request_with_retry(url, auth):
+    session = get_session()
+    for attempt in range(MAX_RETRIES + 1):
+        response = None
+        try:
+            response = session.get(url, auth=auth)
+            if response.status_code not in RETRY_STATUSES and not is_rate_limited(response):
+                return response
+        except requests.ConnectionError:
+            if attempt == MAX_RETRIES:
+                raise
+        if attempt < MAX_RETRIES:
+            time.sleep(get_retry_wait(response, attempt))
+    return response
+
+
+def fetch_tax_database(owner, repo, path, db_key, cache=None):
+    cache = cache or get_disk_cache()
+    try:
+        # Request contents of the repo
+        response = request_with_retry(f'{GITHUB_API_URL}/repos/{owner}/{repo}/contents',
+                                      auth=(owner, f'{db_key}'))
+        response.raise_for_status()
+    except requests.RequestException:
+        # Offline or rate limited, serve the last tree we saw
+        latest = cache.get(LATEST_TREE_KEY)
+        if latest is None:
+            raise
+        return json.loads(latest)
+
+    # Find the SHA for the database tree
+    for node in response.json():
+        if node['name'] == path:
+            data_tree_SHA = node['sha']
+
+    # A tree SHA only changes when something inside it changes
+    tree_key = f"tree-{data_tree_SHA}"
+    cached = cache.get(tree_key)
+    if cached is None:
+        # Request the tree structure, recursively
+        response = request_with_retry(f'{GITHUB_API_URL}/repos/{owner}/{repo}/git/trees/' +
+                                      f'{data_tree_SHA}?recursive=1',
+                                      auth=(owner, f'{db_key}'))
+        response.raise_for_status()
+        cached = response.content
+        cache.set(tree_key, cached)
+    cache.set(LATEST_TREE_KEY, cached)
+    return json.loads(cached)
+
+
+def find_blob_sha(db, bracket_path):
+    # Blob SHAs are listed in the tree response, relative to the tree root
+    for node in db['tree']:
+        if node['type'] == "blob" and node['path'] == bracket_path:
+            return node['sha']
+    return None
+
+
+def download_bracket_data(owner, repo, db_key, bracket_path):
+    # bracket_path is relative to bracket-data-store, as listed in the tree
+    user_bracket_path = f"bracket-data-store/{bracket_path}"
+    # Use the input to load the brackets data
+    response = request_with_retry(f'{GITHUB_RAW_URL}/' +
+                                  f'{owner}/{repo}/refs/heads/main/{user_bracket_path}',
+                                  auth=(owner, f'{db_key}'))
+    if response.status_code == 404:
+        raise ValueError("Specified Data Does Not Exist")
+    response.raise_for_status()
+    return response.content
+
+
+def fetch_bracket_data(owner, repo, db_key, country, fiscal_year, filer_type,
+                       blob_sha=None, cache=None):
+    cache = cache or get_disk_cache()
+    blob_key = f"blob-{blob_sha}"
+    if blob_sha is not None:
+        cached = cache.get(blob_key)
+        if cached is not None:
+            return json.loads(cached)
+    content = download_bracket_data(owner, repo, db_key,
+                                    f"{country}/{fiscal_year}/{filer_type}.json")
+    if blob_sha is not None:
+        cache.set(blob_key, content)
+    return json.loads(content) #dict, but all k-v are str
+
+
+def prefetch_bracket_data(owner, repo, db_key, db, max_workers=PREFETCH_WORKERS,
+                          cache=None):
+    # Download every schedule in the tree that is not already on disk, then
+    # return {(country, year, filer): brackets} for the whole tree
+    cache = cache or get_disk_cache()
+    blobs = {}
+    for node in db['tree']:
+        if node['type'] == "blob" and node['path'].endswith(".json"):
+            blobs[node['path']] = node['sha']
+    contents = {}
+    missing = []
+    for bracket_path, blob_sha in blobs.items():
+        cached = cache.get(f"blob-{blob_sha}")
+        if cached is None:
+            missing.append(bracket_path)
+        else:
+            contents[bracket_path] = cached
+    downloaded = {}
+    failed = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(download_bracket_data, owner, repo, db_key, bracket_path):
+                   bracket_path for bracket_path in missing}
+        for future in as_completed(futures):
+            try:
+                downloaded[futures[future]] = future.result()
+            except Exception as error:
+                failed[futures[future]] = error
+    # Every success is kept even when some files failed, a retry only
+    # downloads the rest
+    cache.set_many({f"blob-{blobs[bracket_path]}": content
+                    for bracket_path, content in downloaded.items()})
+    if failed:
+        bracket_path, error = next(iter(failed.items()))
+        raise RuntimeError(f"{len(failed)} of {len(missing)} bracket files failed to download, "
+                           f"e.g. {bracket_path}: {error}") from error
+    contents.update(downloaded)
+    bracket_data = {}
+    for bracket_path, content in contents.items():
+        country, fiscal_year, file_name = bracket_path.split("/")
+        bracket_data[(country, fiscal_year, file_name.removesuffix(".json"))] = json.loads(content)
+    return bracket_data
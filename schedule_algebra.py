@@ -0,0 +1,92 @@
+import numpy as np
+import calculate_tax_data
+from bracket_schedule import BracketSchedule
+
+# Combinations of bracket schedules, each compiled down to one ordinary
+# BracketSchedule. Tax under a schedule is piecewise linear in income, and so
+# is any sum of schedules or schedule applied to a piecewise linear taxable
+# income, so the result is again a single set of bounds and marginal rates.
+# A whole stack then costs one schedule's evaluation, however many parts it
+# was built from.
+#
+#   federal = deduct_from_schedule(federal_brackets, 14_600)
+#   social_security = cap_schedule(flat_schedule(0.062), 168_600)
+#   total = stack_schedules(federal, social_security, flat_schedule(0.0145))
+#
+# Rates recovered from owed differences are rounded so float noise neither
+# splits a bracket in two nor changes the schedule's digest
+RATE_DECIMALS = 12
+
+
+def flat_schedule(rate):
+    return BracketSchedule.interned([np.inf], [rate])
+
+
+def compile_schedule(bounds, tax_owed):
+    # The schedule of tax_owed(incomes), piecewise linear and zero at no
+    # income, whose kinks all fall on bounds. Each segment's rate is its
+    # slope, neighbours taxed at the same rate are merged
+    bounds = np.unique(np.asarray(bounds, dtype=float))
+    bounds = bounds[np.isfinite(bounds) & (bounds > 0)]
+    bracket_low = np.concatenate(([0.0], bounds))
+    bracket_high = np.concatenate((bounds, [np.inf]))
+    # The open top segment is measured over a span as wide as its lower bound
+    top = bracket_low[-1] + max(bracket_low[-1], 1.0)
+    ends = np.append(bounds, top)
+    owed = tax_owed(np.concatenate(([0.0], ends)))
+    rates = np.round(np.diff(owed) / (ends - bracket_low), RATE_DECIMALS)
+    keep = np.append(rates[1:] != rates[:-1], True)
+    return BracketSchedule.interned(bracket_high[keep], rates[keep])
+
+
+def stack_schedules(*schedules):
+    # Taxes on the same income added together, e.g. federal and state
+    schedules = [BracketSchedule.coerce(schedule) for schedule in schedules]
+    if not schedules:
+        raise ValueError("Stacking needs at least one schedule")
+    bounds = np.concatenate([schedule.finite_bounds() for schedule in schedules])
+    return compile_schedule(bounds, lambda incomes: sum(
+        calculate_tax_data.calculate_tax_owed(incomes, schedule) for schedule in schedules))
+
+
+def map_income(brackets, kinks, taxable_income):
+    # The schedule applied to taxable_income(income), a nondecreasing
+    # piecewise linear map whose kinks are all in kinks. Every schedule bound,
+    # and zero where negative taxable income stops being clipped, is carried
+    # back to the income it is reached at
+    schedule = BracketSchedule.coerce(brackets)
+    kinks = np.unique(np.append(np.asarray(kinks, dtype=float), 0.0))
+    top = kinks[-1] + max(kinks[-1], 1.0)
+    points = np.append(kinks, top)
+    taxable = taxable_income(points)
+    slope = (taxable[-1] - taxable[-2]) / (top - kinks[-1])
+    bounds = np.append(0.0, schedule.finite_bounds())
+    carried = np.interp(bounds, taxable, points)
+    beyond = bounds > taxable[-1]
+    if slope > 0:
+        carried[beyond] = top + (bounds[beyond] - taxable[-1]) / slope
+    else:
+        # Taxable income stops growing before it reaches these bounds
+        carried = carried[~beyond]
+    return compile_schedule(np.concatenate((kinks, carried)), lambda incomes:
+                            calculate_tax_data.calculate_tax_owed(taxable_income(incomes), schedule))
+
+
+def deduct_from_schedule(brackets, deduction):
+    # Tax on income less a deduction taken from the bottom
+    return map_income(brackets, [deduction], lambda incomes: incomes - deduction)
+
+
+def cap_schedule(brackets, wage_base):
+    # Only income up to wage_base is taxed, e.g. the social security wage base
+    return map_income(brackets, [wage_base], lambda incomes: np.minimum(incomes, wage_base))
+
+
+def phase_out_deduction(brackets, deduction, start, rate):
+    # A deduction that shrinks by rate for every dollar of income over start
+    # until none of it is left
+    if rate <= 0:
+        return deduct_from_schedule(brackets, deduction)
+    end = start + deduction / rate
+    return map_income(brackets, [start, end], lambda incomes: incomes - np.clip(
+        deduction - rate * np.maximum(incomes - start, 0), 0, None))
@@ -0,0 +1,119 @@
+import numpy as np
+import calculate_tax_data
+from bracket_schedule import BracketSchedule
+
+# Bound on the (schedules x brackets x incomes) comparison done per chunk
+CHUNK_CELLS = 4_000_000
+
+
+class ScheduleMatrix:
+    # Every schedule stacked into padded (schedule x bracket) arrays so one
+    # income, or many, is evaluated against all of them in a single pass.
+    # Identical schedules share a row, keys map (country, year, filer) to it
+    def __init__(self, keys, schedules):
+        self.keys = list(keys)
+        rows = {}
+        unique = []
+        key_rows = []
+        for schedule in schedules:
+            schedule = BracketSchedule.coerce(schedule)
+            if schedule.digest not in rows:
+                rows[schedule.digest] = len(unique)
+                unique.append(schedule)
+            key_rows.append(rows[schedule.digest])
+        self.schedules = unique
+        self.key_rows = np.array(key_rows, dtype=np.intp)
+        width = max(len(schedule) for schedule in unique)
+        # Padding sits above each schedule's open top bracket so it is never
+        # reached, its bounds are inf and its rate is unused
+        shape = (len(unique), width)
+        self.bracket_low = np.full(shape, np.inf)
+        self.bracket_high = np.full(shape, np.inf)
+        self.bracket_rate = np.zeros(shape)
+        self.cum_owed_low = np.zeros(shape)
+        self.bracket_count = np.zeros(len(unique), dtype=np.intp)
+        for row, schedule in enumerate(unique):
+            count = len(schedule)
+            self.bracket_low[row, :count] = schedule.bracket_low
+            self.bracket_high[row, :count] = schedule.bracket_high
+            self.bracket_rate[row, :count] = schedule.bracket_rate
+            self.cum_owed_low[row, :count] = schedule.cum_owed_low
+            self.bracket_count[row] = count
+
+    @classmethod
+    def from_bracket_data(cls, bracket_data: dict):
+        # {(country, year, filer): brackets}, brackets as a dict or schedule
+        return cls(bracket_data.keys(), bracket_data.values())
+
+    @classmethod
+    def from_store(cls, store):
+        keys = list(store.keys())
+        return cls(keys, [store.get(*key) for key in keys])
+
+    def locate(self, incomes):
+        # Bracket index of every income in every unique schedule, (S x m)
+        incomes = np.asarray(incomes, dtype=float)
+        index = np.empty((len(self.schedules), len(incomes)), dtype=np.intp)
+        chunk = max(1, CHUNK_CELLS // self.bracket_high.size)
+        for start in range(0, len(incomes), chunk):
+            part = incomes[start:start + chunk]
+            # Brackets whose upper bound is at or below the income are full
+            full = self.bracket_high[:, :, None] <= part[None, None, :]
+            index[:, start:start + chunk] = full.sum(axis=1)
+        return index
+
+    def evaluate_unique(self, incomes):
+        incomes = np.clip(np.asarray(incomes, dtype=float), 0, None)
+        index = self.locate(incomes)
+        bracket_low = np.take_along_axis(self.bracket_low, index, axis=1)
+        bracket_rate = np.take_along_axis(self.bracket_rate, index, axis=1)
+        cum_owed_low = np.take_along_axis(self.cum_owed_low, index, axis=1)
+        owed = cum_owed_low + (incomes[None, :] - bracket_low) * bracket_rate
+        with np.errstate(divide="ignore", invalid="ignore"):
+            effective_rate = np.where(incomes > 0, owed / incomes, 0.0)
+        return {
+            "income": incomes,
+            "owed": owed,
+            "effective_rate": effective_rate,
+            "marginal_rate": bracket_rate,
+        }
+
+    def evaluate(self, incomes):
+        # Results per key, arrays shaped (keys x incomes)
+        result = self.evaluate_unique(incomes)
+        for column in ["owed", "effective_rate", "marginal_rate"]:
+            result[column] = result[column][self.key_rows]
+        return result
+
+    def evaluate_frame(self, incomes):
+        # Tidy year x filer x income table
+        import pandas as pd
+        result = self.evaluate(incomes)
+        key_count, income_count = result["owed"].shape
+        keys = pd.DataFrame(self.keys, columns=["country", "year", "filer"])
+        data = keys.loc[np.repeat(np.arange(key_count), income_count)].reset_index(drop=True)
+        data["income"] = np.tile(result["income"], key_count)
+        for column in ["owed", "effective_rate", "marginal_rate"]:
+            data[column] = result[column].ravel()
+        return data
+
+    def income_for_owed(self, owed):
+        # Smallest income owing each target in every schedule, (keys x targets)
+        targets = np.atleast_1d(np.asarray(owed, dtype=float))
+        income = calculate_tax_data.solve_income_for_owed(
+            self.bracket_low, self.bracket_high, self.bracket_rate,
+            self.cum_owed_low, targets)
+        return income[self.key_rows]
+
+    def income_for_effective_rate(self, effective_rate):
+        targets = np.atleast_1d(np.asarray(effective_rate, dtype=float))
+        income = calculate_tax_data.solve_income_for_effective_rate(
+            self.bracket_low, self.bracket_high, self.bracket_rate,
+            self.cum_owed_low, targets)
+        return income[self.key_rows]
+
+    def income_range_for_marginal_rate(self, marginal_rate):
+        targets = np.atleast_1d(np.asarray(marginal_rate, dtype=float))
+        low, high = calculate_tax_data.solve_income_range_for_marginal_rate(
+            self.bracket_low, self.bracket_high, self.bracket_rate, targets)
+        return low[self.key_rows], high[self.key_rows]
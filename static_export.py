@@ -0,0 +1,133 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import bracket_store
+import chart_cache
+from bracket_schedule import BracketSchedule
+
+# Static chart assets for a server-less build of the explainer. Every unique
+# schedule in the local bracket store gets its step and owed charts, the
+# interactive breakdown and breakdowns at REFERENCE_INCOMES. Specs are built
+# on a process pool and written as minified JSON named by a hash of their
+# content, so identical specs are stored once. manifest.json maps
+#   tree:      {country: {year: {filer: schedule digest}}}
+#   schedules: {schedule digest: {chart name: file}}
+# An export only rebuilds schedules missing from the previous manifest,
+# i.e. whose brackets changed, and prunes files nothing refers to any more.
+# A change to the chart code or reference incomes rebuilds everything.
+# Runs entirely offline from the JSON files in bracket-data-store.
+EXPORT_PATH = "static-export"
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+SCHEDULE_KINDS = ("bracket_step", "tax_owed", "interactive_breakdown")
+REFERENCE_INCOMES = (25_000, 50_000, 65_000, 100_000, 250_000, 1_000_000)
+
+
+def get_builder_hash(reference_incomes=REFERENCE_INCOMES):
+    return chart_cache.get_builder_hash(chart_cache.BUILDER_SOURCES + ("static_export.py",),
+                                        str(list(reference_incomes)))
+
+
+def compact_json(spec):
+    # Fill the embedding element's width, as the app draws them
+    spec["width"] = "container"
+    return json.dumps(spec, separators=(",", ":"))
+
+
+def export_schedule(schedule, reference_incomes=REFERENCE_INCOMES):
+    # {chart name: spec JSON} for one schedule, runs in a pool worker
+    specs = {kind: compact_json(json.loads(chart_cache.build_chart_spec(kind, schedule)))
+             for kind in SCHEDULE_KINDS}
+    # One altair build covers every reference income
+    for income in reference_incomes:
+        spec = json.loads(specs["interactive_breakdown"])
+        specs[f"breakdown-{income}"] = compact_json(
+            chart_cache.set_breakdown_income(spec, float(income), bind=False))
+    return specs
+
+
+def write_spec(export_path, name, spec):
+    # Content addressed, an identical spec already on disk is left alone
+    kind = name.split("-")[0]
+    file_name = f"{kind}-{hashlib.sha256(spec.encode()).hexdigest()[:20]}.json"
+    file_path = os.path.join(export_path, file_name)
+    if not os.path.exists(file_path):
+        temporary_path = file_path + ".tmp"
+        with open(temporary_path, "w") as file:
+            file.write(spec)
+        os.replace(temporary_path, file_path)
+    return file_name
+
+
+def load_manifest(export_path, builder_hash):
+    # The previous export's schedules, empty when they can't be reused
+    try:
+        with open(os.path.join(export_path, MANIFEST_NAME)) as file:
+            manifest = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("builder") != builder_hash:
+        return {}
+    return {digest: charts for digest, charts in manifest["schedules"].items()
+            if all(os.path.exists(os.path.join(export_path, file_name))
+                   for file_name in charts.values())}
+
+
+def prune_files(export_path, keep):
+    removed = 0
+    for file_name in os.listdir(export_path):
+        if file_name.endswith(".json") and file_name != MANIFEST_NAME and file_name not in keep:
+            os.remove(os.path.join(export_path, file_name))
+            removed += 1
+    return removed
+
+
+def run_export(export_path=EXPORT_PATH, workers=None, reference_incomes=REFERENCE_INCOMES,
+               force=False, source_path=bracket_store.SOURCE_PATH):
+    os.makedirs(export_path, exist_ok=True)
+    builder_hash = get_builder_hash(reference_incomes)
+    previous = {} if force else load_manifest(export_path, builder_hash)
+    # Always the JSON tree itself, a published site must never carry rates
+    # from a packed store built before the last edit
+    schedules = {(country, year, filer): BracketSchedule.from_dict(brackets)
+                 for country, year, filer, brackets in bracket_store.walk_source_tree(source_path)}
+    unique = {schedule.digest: schedule for schedule in schedules.values()}
+    pending = [schedule for digest, schedule in unique.items() if digest not in previous]
+    exported = {digest: previous[digest] for digest in unique if digest in previous}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(export_schedule, pending, [reference_incomes] * len(pending),
+                           chunksize=4)
+        for schedule, specs in zip(pending, results):
+            exported[schedule.digest] = {name: write_spec(export_path, name, spec)
+                                         for name, spec in specs.items()}
+    tree = {}
+    for (country, year, filer), schedule in schedules.items():
+        tree.setdefault(country, {}).setdefault(year, {})[filer] = schedule.digest
+    manifest = {"version": MANIFEST_VERSION, "builder": builder_hash,
+                "reference_incomes": list(reference_incomes), "tree": tree,
+                "schedules": dict(sorted(exported.items()))}
+    temporary_path = os.path.join(export_path, MANIFEST_NAME + ".tmp")
+    with open(temporary_path, "w") as file:
+        json.dump(manifest, file, separators=(",", ":"))
+    os.replace(temporary_path, os.path.join(export_path, MANIFEST_NAME))
+    keep = {file_name for charts in exported.values() for file_name in charts.values()}
+    return {"schedules": len(schedules), "unique": len(unique), "rebuilt": len(pending),
+            "files": len(keep), "pruned": prune_files(export_path, keep)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export every schedule's chart specs as static files")
+    parser.add_argument("--output", default=EXPORT_PATH)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--incomes", type=int, nargs="+", default=list(REFERENCE_INCOMES),
+                        help="Reference incomes to export breakdown charts at")
+    parser.add_argument("--force", action="store_true", help="Rebuild every schedule")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    report = run_export(args.output, args.workers, tuple(args.incomes), args.force)
+    print(f"{report['schedules']} schedules, {report['unique']} unique, {report['rebuilt']} rebuilt, "
+          f"{report['files']} files, {report['pruned']} pruned in "
+          f"{time.perf_counter() - start:.1f} s to {args.output}")
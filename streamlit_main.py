@@ -1,6 +1,5 @@
 import numpy as np
 import streamlit as st
-import requests
 import glob
 import json
 import locale
@@ -8,12 +7,15 @@ locale.setlocale(locale.LC_ALL, 'en_US')
 from datetime import datetime
 import urllib.parse
 
-# 3rd party Streamlit components
-from st_copy_to_clipboard import st_copy_to_clipboard
-
 # My stuff
-import create_graph
 import calculate_tax_data
+import bracket_store
+import remote_data
+import chart_cache
+import instrumentation
+from bracket_schedule import BracketSchedule
+# Imported where they are first used, below the first paint: the clipboard
+# component, create_graph (altair, pandas) and schedule_matrix
 
 
 LOCAL_DEVELOPMENT = False
@@ -21,6 +23,10 @@ owner = st.secrets.database.db_username
 db_key = st.secrets.database.db_api_key
 repo = "understanding-progressive-taxation"
 path = "bracket-data-store"
+# Finished calculator results are kept per process for this many share
+# links, and warmed from POPULAR_LINKS_PATH: one link or query string a line
+SHARE_RESULT_ENTRIES = 512
+POPULAR_LINKS_PATH = "popular-links.txt"
 
 
 def fetch_parameter(param_name, default_value):
@@ -34,29 +40,25 @@ def set_parameter(param_name, value):
     st.query_params[param_name] = value
 
 
+@instrumentation.timed_stage(cached=True)
 @st.cache_data
 def get_tax_database_remote(owner, repo, path, db_key):
-    # Request contents of the repo
-    response = requests.get(f'https://api.github.com/repos/' + 
-                            f'{owner}/{repo}/contents',
-                            auth=(owner, f'{db_key}'))
-    response = response.json()
-
-    # Find the SHA for the database tree
-    for node in response:
-        if node['name'] == path:
-            data_tree_SHA = node['sha']
-
-    # Request the tree structure, recursively
-    response = requests.get(f'https://api.github.com/repos/' + 
-                            f'{owner}/{repo}/git/trees/' + 
-                            f'{data_tree_SHA}?recursive=1',
-                            auth=(owner, f'{db_key}'))
-    response = response.json()
-    return response
+    # Backed by a disk cache keyed by tree SHA, survives restarts
+    instrumentation.record_cache_miss()
+    return remote_data.fetch_tax_database(owner, repo, path, db_key)
 
 
+@instrumentation.timed_stage(cached=True)
+@st.cache_data
 def get_tax_database_local(path):
+    instrumentation.record_cache_miss()
+    # Prefer the manifest written with the packed store, then the store's index
+    tree = bracket_store.load_tree_manifest()
+    if tree is not None:
+        return tree
+    store = bracket_store.load_packed_store()
+    if store is not None:
+        return store.tree()
     # Use local files
     tree = glob.glob("**", root_dir=path, recursive=True)
     file_tree = {}
@@ -91,54 +93,58 @@ def parse_db_structure(db):
     return file_tree
 
 
-def get_country_options(file_tree):
-    countries = []
-    for country in file_tree.keys():
-        countries.append(country)
-    return countries
-
-
-def get_year_options(file_tree):
-    fiscal_years = []
-    for fiscal_year in file_tree.keys():
-        fiscal_years.append(fiscal_year)
-    # Reverse to show most recent years first
-    fiscal_years.reverse()
-    return fiscal_years
+@instrumentation.timed_stage(cached=True)
+@st.cache_data
+def get_bracket_data_remote(owner, repo, db_key, country, fiscal_year, filer_type,
+                            blob_sha=None):
+    # Backed by a disk cache keyed by blob SHA, survives restarts
+    instrumentation.record_cache_miss()
+    return remote_data.fetch_bracket_data(owner, repo, db_key, country,
+                                          fiscal_year, filer_type, blob_sha)
+
+@instrumentation.timed_stage(cached=True)
+@st.cache_data
+def get_all_bracket_data_remote(owner, repo, path, db_key):
+    # Warm every schedule at once over a pooled session, {(country, year, filer): brackets}
+    instrumentation.record_cache_miss()
+    db = get_tax_database_remote(owner, repo, path, db_key)
+    return remote_data.prefetch_bracket_data(owner, repo, db_key, db)
 
+@instrumentation.timed_stage()
+def get_bracket_data_local(country, fiscal_year, filer_type):
+    return bracket_store.load_schedule(country, fiscal_year, filer_type)
 
-def get_filer_options(file_tree):
-    filer_types = []
-    for filer_type in file_tree.keys():
-        # The filer type is part of the file name, remove the extension
-        filer_type = filer_type.removesuffix(".json")
-        filer_types.append(filer_type)
-    return filer_types
+def get_all_bracket_data_local():
+    return bracket_store.load_schedules(path)
 
 
-@st.cache_data
-def get_bracket_data_remote(owner, repo, db_key, country, fiscal_year, filer_type):
-    user_bracket_path = f"bracket-data-store/{country}/{fiscal_year}/{filer_type}.json"
-    # Use the input to load the brackets data
-    response = requests.get(f'https://raw.githubusercontent.com/' + 
-                            f'{owner}/{repo}/refs/heads/main/{user_bracket_path}',
-                            auth=(owner, f'{db_key}'))
-    print(response.status_code)
-    if response.status_code != 404:
-        brackets = response.json() #dict, but all k-v are str
-        return brackets
+@instrumentation.timed_stage(cached=True)
+@st.cache_resource
+def get_schedule_matrix(local_development):
+    # Every schedule stacked once per process, shared by all sessions
+    instrumentation.record_cache_miss()
+    from schedule_matrix import ScheduleMatrix
+    if local_development:
+        bracket_data = get_all_bracket_data_local()
     else:
-        raise ValueError("Specified Data Does Not Exist")
+        bracket_data = get_all_bracket_data_remote(owner, repo, path, db_key)
+    return ScheduleMatrix.from_bracket_data(bracket_data)
 
-def get_bracket_data_local(country, fiscal_year, filer_type):
-    user_bracket_path = f"bracket-data-store/{country}/{fiscal_year}/{filer_type}.json"
-    with open(user_bracket_path) as file:
-            brackets = json.load(file)
-            return brackets
 
+@instrumentation.timed_stage()
 def coerce_bracket_data_types(brackets):
-    brackets = {int(k) if k.isdigit() else np.inf:float(v) for k,v in brackets.items()}
-    return brackets
+    # Compile once, every consumer reads the schedule's arrays directly
+    return BracketSchedule.coerce(brackets)
+
+
+def load_brackets(country, fiscal_year, filer_type, db=None):
+    if LOCAL_DEVELOPMENT:
+        brackets = get_bracket_data_local(country, fiscal_year, filer_type)
+    else:
+        blob_sha = remote_data.find_blob_sha(db, f"{country}/{fiscal_year}/{filer_type}.json")
+        brackets = get_bracket_data_remote(owner, repo, db_key, country, 
+                                           fiscal_year, filer_type, blob_sha)
+    return coerce_bracket_data_types(brackets)
 
 
 def convert_to_currency(value):
@@ -164,144 +170,319 @@ def get_base_url():
     return st_base_url
 
 
+def parse_income(value):
+    # Incomes to the cent, whole amounts as an int so links read income=11925
+    # rather than the 11925.0 the inverse modes produce
+    income = round(float(value), 2)
+    if not np.isfinite(income):
+        raise ValueError(f"Income must be finite, not {value}")
+    return int(income) if income.is_integer() else income
+
+
 def get_param_url(country, fiscal_year, filer_type, income):
     param_url = (f"/?country={country}" +
                 f"&year={fiscal_year}" +
                 f"&filer={filer_type}" +
-                f"&income={income}" +
+                f"&income={parse_income(income)}" +
                 f"#try-it-yourself")
     # Replace spaces with %20
     param_url = param_url.replace(" ", "%20")
     return param_url
 
 
+def parse_share_link(link):
+    # (country, year, filer, income) of a link made by get_param_url, or of
+    # just its query string
+    link = link.strip()
+    query = urllib.parse.urlsplit(link).query or link.lstrip("?").split("#")[0]
+    params = dict(urllib.parse.parse_qsl(query))
+    return (params.get("country", "United States"), params["year"], params["filer"],
+            parse_income(params.get("income", 65000)))
+
+
+def get_share_key(country, fiscal_year, filer_type, income, brackets):
+    # Links spell the same result many ways, income=65000 and 65000.0 among
+    # them, the page and warm_share_result_cache both read them with
+    # parse_income. The digest keeps an updated schedule from serving old results
+    return (country, str(fiscal_year), filer_type, parse_income(income), brackets.digest)
+
+
+@st.cache_resource
+def get_share_result_cache():
+    return chart_cache.LRUCache(SHARE_RESULT_ENTRIES)
+
+
+def build_share_result(income, brackets):
+    instrumentation.record_cache_miss()
+    tax_breakdown_data = calculate_tax_data.calculate_tax_breakdown_data(income, brackets)
+    with instrumentation.stage("format_table"):
+        tax_breakdown_data_display = tax_breakdown_data
+        total_owed = convert_to_currency(tax_breakdown_data['bracket_owed'].sum())
+
+        tax_breakdown_data_display['bracket_low'] = tax_breakdown_data_display['bracket_low'].apply(convert_to_currency)
+        tax_breakdown_data_display['bracket_high'] = tax_breakdown_data_display['bracket_high'].apply(convert_to_currency)
+        tax_breakdown_data_display['bracket_rate'] = tax_breakdown_data_display['bracket_rate'].apply(convert_to_percent)
+        tax_breakdown_data_display['bracket_owed'] = tax_breakdown_data_display['bracket_owed'].apply(convert_to_currency)
+        mapper = {
+            "bracket_low": "From...",
+            "bracket_high": "... to",
+            "bracket_rate": "You pay...",
+            "bracket_owed": "...which is"
+        }
+        tax_breakdown_data_display = tax_breakdown_data_display.rename(mapper, axis='columns')
+        tax_breakdown_data_display = tax_breakdown_data_display.drop(["cum_owed_low", "cum_owed_high"], axis='columns')
+    # Sessions share the entry, the spec is kept as JSON so none can edit it
+    chart_spec = chart_cache.get_interactive_breakdown_spec(brackets, float(income), bind=False)
+    return {
+        "chart_spec": json.dumps(chart_spec),
+        "table": tax_breakdown_data_display,
+        "total_owed": total_owed,
+    }
+
+
+def get_share_result(country, fiscal_year, filer_type, income, brackets):
+    # The chart, table and total for one share link, built once per process.
+    # Sessions share the entry, each caller gets its own copy of the table
+    key = get_share_key(country, fiscal_year, filer_type, income, brackets)
+    result = get_share_result_cache().get_or_create(key, lambda: build_share_result(income, brackets))
+    return {**result, "table": result["table"].copy()}
+
+
+@st.cache_resource
+def warm_share_result_cache(local_development, links_path=POPULAR_LINKS_PATH):
+    # Once per process. Links that no longer resolve are skipped
+    try:
+        with open(links_path) as file:
+            links = [line for line in file if line.strip() and not line.startswith("#")]
+    except FileNotFoundError:
+        return 0
+    db = None if local_development else get_tax_database_remote(owner, repo, path, db_key)
+    warmed = 0
+    for link in links:
+        try:
+            country, fiscal_year, filer_type, income = parse_share_link(link)
+            brackets = load_brackets(country, fiscal_year, filer_type, db)
+        except (KeyError, ValueError, OSError):
+            continue
+        get_share_result(country, fiscal_year, filer_type, income, brackets)
+        warmed += 1
+    return warmed
+
+
+@instrumentation.timed_stage(cached=True)
+@st.cache_data
+def get_example_results(local_development, country, fiscal_year, filer_type, income):
+    # Everything the explainer shows depends only on these, one entry for
+    # every session
+    instrumentation.record_cache_miss()
+    db = None if local_development else get_tax_database_remote(owner, repo, path, db_key)
+    brackets = load_brackets(country, fiscal_year, filer_type, db)
+    # All three specs can be pre-rendered, so first paint needs no altair
+    return {
+        "tax_paid": float(calculate_tax_data.calculate_tax_batch([income], brackets)["owed"][0]),
+        "bracket_breakdown": chart_cache.get_interactive_breakdown_spec(brackets, float(income),
+                                                                        bind=False),
+        "bracket_step": chart_cache.get_chart_spec("bracket_step", brackets),
+        "tax_owed": chart_cache.get_chart_spec("tax_owed", brackets),
+    }
+
+
+@instrumentation.timed_stage()
+def render_explainer():
+    st.markdown("## What are Progressive Tax Brackets?")
+    st.markdown("""The United States uses a progressive tax system. This means that 
+                the amount you pay is broken out into several *tax brackets*. In
+                each bracket you pay a certain rate on the income in that bracket. 
+                The tax rate of brackets *progressively* increase as the income
+                levels rise.""")
+    st.markdown("""This makes it harder to estimate what you owe in your head, but 
+                it also means that if you make less you keep a bigger percent of 
+                what you earn. Earning more also doesn't retroactively punish you 
+                because the parts of your income that fall into lower brackets are 
+                still taxed at a lower rate.""")
+    example_income = 65000
+    example_country = "United States"
+    # example_year = str(datetime.now().year)
+    example_year = "2025"
+    example_status = "Single Filer"
+    st.markdown(f"""Here's an example for someone who makes 
+                **{convert_to_currency(example_income)}** in 
+                **{example_year}** as a **{example_status}**:""")
+
+    example = get_example_results(LOCAL_DEVELOPMENT, example_country, example_year,
+                                  example_status, example_income)
+    st.vega_lite_chart(example["bracket_breakdown"], theme=None, use_container_width=True)
+    example_tax_paid = example["tax_paid"]
+    example_eff_rate_fmt = convert_to_percent(example_tax_paid/example_income, 2)
+    example_income_fmt = convert_to_currency(example_income)
+    example_tax_paid_fmt = convert_to_currency(example_tax_paid)
+
+    st.markdown("""Here's another way to think about it. Whenever your income is
+                high enough to enter a new bracket your *marginal tax rate* increases.
+                The marginal tax rate is the amount of tax you pay on the next dollar
+                earned.""")
+
+    st.vega_lite_chart(example["bracket_step"], theme=None, use_container_width=True)
+
+
+    st.markdown(f"""Another measure is the *effective tax rate*. That's the calculated 
+                percent of your income that you owe as tax. For the above example, 
+                paying **\{example_tax_paid_fmt}** in tax on **\{example_income_fmt}** 
+                of income is an effective tax rate of **{example_eff_rate_fmt}**.""")
+    st.markdown(f"""In the graph below you can see that after a certain amount of income
+                the portion of your income you pay in taxes becomes a straight line.
+                This is because at the top end there aren't as many brackets, so
+                most of the income gets taxed at the higher rates. However, those early
+                brackets still tax you at a lower rate.""")
+    st.vega_lite_chart(example["tax_owed"], theme=None, use_container_width=True)
+
+
+# Widgets in here only rerun this function, the rest of the page stays put
+@st.fragment
+@instrumentation.timed_stage()
+def render_calculator(tree, db=None):
+    st.markdown("## Try it yourself")
+    st.markdown("""You can use this calculator to simulate US Federal tax brackets.
+                Data for years 2021-1862 sourced from [TaxFoundation.org](https://taxfoundation.org/data/all/federal/historical-income-tax-rates-brackets/).
+                Other data sourced by hand. Do note that this calculator does not 
+                adjust for inflation""")
+    # countries = bracket_store.get_country_options(tree)
+    # country = st.selectbox("Select your country:", countries)
+    # country = "United States"
+    country = fetch_parameter("country", "United States")
+    fiscal_years = bracket_store.get_year_options(tree[country])
+    fiscal_year = fetch_parameter("year", fiscal_years[0])
+    i = find_default_index(fiscal_years, fiscal_year)
+    fiscal_year = st.selectbox("Select the fiscal year:", fiscal_years, index=i,
+                               help="""Inflation changes the value of dollars. 
+                               This is not accounted for by this calculator.
+                               Use an inflation calculator to determine your equivalent
+                               income in another year.""")
+    filer_types = bracket_store.get_filer_options(tree[country][fiscal_year])
+    filer_type = fetch_parameter("filer", filer_types[0])
+    i = find_default_index(filer_types, filer_type)
+    filer_type = st.selectbox("Choose your filing status:", filer_types, index=i,
+                              help="Tax brackets typically favor filers with dependents.")
+    try:
+        income = parse_income(fetch_parameter("income", 65000))
+    except ValueError:
+        income = 65000
+
+    brackets = load_brackets(country, fiscal_year, filer_type, db)
+
+    calculator_modes = ["My income", "Tax owed", "Effective tax rate", "Marginal tax rate"]
+    calculator_mode = st.radio("Start from:", calculator_modes, horizontal=True,
+                               help="""Work backwards from a tax amount or rate to the
+                               income that produces it.""")
+    if calculator_mode == "My income":
+        user_income = st.number_input(label="Input your taxable income (in your country's currency):",
+                                        key="income_input", value=income)
+    elif calculator_mode == "Tax owed":
+        target_owed = st.number_input(label="Input the tax owed:", key="owed_input",
+                                      min_value=0.0, value=10000.0)
+        user_income = calculate_tax_data.calculate_income_for_owed(target_owed, brackets)[0]
+        if np.isnan(user_income):
+            st.warning(f"No income owes {convert_to_currency(target_owed)} with these brackets.")
+            st.stop()
+        user_income = round(float(user_income), 2)
+        st.markdown(f"""An income of **{convert_to_currency(user_income)}** owes 
+                    **{convert_to_currency(target_owed)}**.""")
+    elif calculator_mode == "Effective tax rate":
+        target_rate = st.number_input(label="Input the effective tax rate (%):",
+                                      key="effective_rate_input", min_value=0.0,
+                                      max_value=100.0, value=15.0) / 100
+        user_income = calculate_tax_data.calculate_income_for_effective_rate(target_rate, brackets)[0]
+        if np.isnan(user_income):
+            st.warning(f"""No income is taxed at an effective rate of 
+                       {convert_to_percent(target_rate)} with these brackets.""")
+            st.stop()
+        user_income = round(float(user_income), 2)
+        st.markdown(f"""An income of **{convert_to_currency(user_income)}** has an 
+                    effective tax rate of **{convert_to_percent(target_rate)}**.""")
+    else:
+        marginal_rates = sorted(set(brackets.bracket_rate.tolist()))
+        target_rate = st.selectbox("Choose the marginal tax rate:", marginal_rates,
+                                   format_func=convert_to_percent, key="marginal_rate_input")
+        low, high = calculate_tax_data.calculate_income_range_for_marginal_rate(target_rate, brackets)
+        high_fmt = convert_to_currency(high[0]) if np.isfinite(high[0]) else "any higher income"
+        st.markdown(f"""Income from **{convert_to_currency(low[0])}** to **{high_fmt}** 
+                    is taxed at a marginal rate of **{convert_to_percent(target_rate)}**.""")
+        # Show the breakdown with the whole bracket filled
+        user_income = float(high[0]) if np.isfinite(high[0]) else float(low[0])
+
+    with instrumentation.stage("share_result", cached=True):
+        result = get_share_result(country, fiscal_year, filer_type, user_income, brackets)
+    in_browser = st.toggle("Adjust income inside the chart",
+                           help="""The chart recalculates in your browser as you
+                           change its income box, without reloading the page.""")
+    if in_browser:
+        st.caption("The table and share link below use the income entered above.")
+        # The schedule's cached spec with this income filled in, nothing to build
+        with instrumentation.stage("breakdown_chart_spec", cached=True):
+            chart_spec = chart_cache.get_interactive_breakdown_spec(brackets, float(user_income))
+    else:
+        chart_spec = json.loads(result["chart_spec"])
+    st.vega_lite_chart(chart_spec, theme=None, use_container_width=True)
+
+    st.write(f"Here's a tabular breakdown.")
+    st.markdown(f"""If you earn **{convert_to_currency(user_income)}** in 
+                **{fiscal_year}** as a **{filer_type}** while living in 
+                **{country}**...""")
+    st.dataframe(result["table"], hide_index=True, use_container_width=True)
+    st.markdown(f"Which amounts to a total federal tax obligation of **{result['total_owed']}**.")
+
+    with st.columns((2,1,2))[1]:
+        from st_copy_to_clipboard import st_copy_to_clipboard
+        base_url = get_base_url()
+        param_url = get_param_url(country, fiscal_year, filer_type, user_income)
+        st_copy_to_clipboard(base_url+param_url, 
+                             before_copy_label="Share this result 📋",
+                             after_copy_label="Copied your result! ✅")
+
+    st.markdown("## Across the years")
+    st.markdown(f"""How much would **{convert_to_currency(user_income)}** have owed in 
+                every year we have data for? Each line is a filing status.""")
+    # Every schedule has to be loaded for this, only on request so it never
+    # holds up the first page
+    if not st.toggle("Compare every year", key="history_toggle"):
+        return
+    history_measures = {"Effective Tax Rate": "effective_rate", "Owed": "owed",
+                        "Marginal Tax Rate": "marginal_rate"}
+    history_measure = st.radio("Show:", history_measures.keys(), horizontal=True)
+    schedule_matrix = get_schedule_matrix(LOCAL_DEVELOPMENT)
+    with instrumentation.stage("history"):
+        history_data = schedule_matrix.evaluate_frame([user_income])
+        history_data = history_data[history_data["country"] == country]
+        import create_graph
+        history_chart = create_graph.TaxHistoryGraph(history_data, history_measures[history_measure])
+        st.altair_chart(history_chart.get_chart(), theme=None, use_container_width=True)
+
+
+def render_debug_panel():
+    # Rolling per-stage aggregates for this process, INSTRUMENTATION=timing or memory
+    with st.expander("Stage timings"):
+        st.dataframe(instrumentation.summarize(), hide_index=True, use_container_width=True)
+        st.caption("Process-wide caches")
+        st.dataframe([{"cache": "share results", **get_share_result_cache().stats()},
+                      {"cache": "chart specs", **chart_cache.chart_spec_cache.stats()}],
+                     hide_index=True, use_container_width=True)
+        if st.button("Reset timings"):
+            instrumentation.reset()
+
+
 if LOCAL_DEVELOPMENT:
+    db = None
     tree = get_tax_database_local(path)
 else:
     db = get_tax_database_remote(owner, repo, path, db_key)
     tree = parse_db_structure(db)
 
-st.markdown("## What are Progressive Tax Brackets?")
-st.markdown("""The United States uses a progressive tax system. This means that 
-            the amount you pay is broken out into several *tax brackets*. In
-            each bracket you pay a certain rate on the income in that bracket. 
-            The tax rate of brackets *progressively* increase as the income
-            levels rise.""")
-st.markdown("""This makes it harder to estimate what you owe in your head, but 
-            it also means that if you make less you keep a bigger percent of 
-            what you earn. Earning more also doesn't retroactively punish you 
-            because the parts of your income that fall into lower brackets are 
-            still taxed at a lower rate.""")
-example_income = 65000
-example_country = "United States"
-# example_year = str(datetime.now().year)
-example_year = "2025"
-example_status = "Single Filer"
-st.markdown(f"""Here's an example for someone who makes 
-            **{convert_to_currency(example_income)}** in 
-            **{example_year}** as a **{example_status}**:""")
-
-if LOCAL_DEVELOPMENT:
-    brackets = get_bracket_data_local(example_country, example_year, example_status)
-else:
-    brackets = get_bracket_data_remote(owner, repo, db_key, example_country, 
-                                       example_year, example_status)
-brackets = coerce_bracket_data_types(brackets)
-example_data = calculate_tax_data.calculate_tax_breakdown_data(example_income, brackets)
-example_chart = create_graph.TaxBracketBreakdownGraph(example_data, example_income, brackets)
-st.altair_chart(example_chart.get_full_combochart(), theme=None, use_container_width=True)
-example_tax_paid = example_data['cum_owed_high'].max()
-example_eff_rate_fmt = convert_to_percent(example_tax_paid/example_income, 2)
-example_income_fmt = convert_to_currency(example_income)
-example_tax_paid_fmt = convert_to_currency(example_tax_paid)
-
-st.markdown("""Here's another way to think about it. Whenever your income is
-            high enough to enter a new bracket your *marginal tax rate* increases.
-            The marginal tax rate is the amount of tax you pay on the next dollar
-            earned.""")
-
-bracket_step_chart = create_graph.TaxBracketStepGraph(brackets)
-st.altair_chart(bracket_step_chart.get_chart(), theme=None, use_container_width=True)
-
-
-st.markdown(f"""Another measure is the *effective tax rate*. That's the calculated 
-            percent of your income that you owe as tax. For the above example, 
-            paying **\{example_tax_paid_fmt}** in tax on **\{example_income_fmt}** 
-            of income is an effective tax rate of **{example_eff_rate_fmt}**.""")
-st.markdown(f"""In the graph below you can see that after a certain amount of income
-            the portion of your income you pay in taxes becomes a straight line.
-            This is because at the top end there aren't as many brackets, so
-            most of the income gets taxed at the higher rates. However, those early
-            brackets still tax you at a lower rate.""")
-tax_owed_graph = create_graph.TaxOwedGraph(brackets)
-st.altair_chart(tax_owed_graph.get_chart(), theme=None, use_container_width=True)
-
-
-st.markdown("## Try it yourself")
-st.markdown("""You can use this calculator to simulate US Federal tax brackets.
-            Data for years 2021-1862 sourced from [TaxFoundation.org](https://taxfoundation.org/data/all/federal/historical-income-tax-rates-brackets/).
-            Other data sourced by hand. Do note that this calculator does not 
-            adjust for inflation""")
-# countries = get_country_options(tree)
-# country = st.selectbox("Select your country:", countries)
-# country = "United States"
-country = fetch_parameter("country", "United States")
-fiscal_years = get_year_options(tree[country])
-fiscal_year = fetch_parameter("year", fiscal_years[0])
-i = find_default_index(fiscal_years, fiscal_year)
-fiscal_year = st.selectbox("Select the fiscal year:", fiscal_years, index=i,
-                           help="""Inflation changes the value of dollars. 
-                           This is not accounted for by this calculator.
-                           Use an inflation calculator to determine your equivalent
-                           income in another year.""")
-filer_types = get_filer_options(tree[country][fiscal_year])
-filer_type = fetch_parameter("filer", filer_types[0])
-i = find_default_index(filer_types, filer_type)
-filer_type = st.selectbox("Choose your filing status:", filer_types, index=i,
-                          help="Tax brackets typically favor filers with dependents.")
-income = int(fetch_parameter("income", 65000))
-user_income = st.number_input(label="Input your taxable income (in your country's currency):",
-                                key="income_input", value=income)
-
-if LOCAL_DEVELOPMENT:
-    brackets = get_bracket_data_local(country, fiscal_year, filer_type)
-else:
-    brackets = get_bracket_data_remote(owner, repo, db_key, country, 
-                                       fiscal_year, filer_type)
-brackets = coerce_bracket_data_types(brackets)
-
-tax_breakdown_data = calculate_tax_data.calculate_tax_breakdown_data(user_income, brackets)
-chart = create_graph.TaxBracketBreakdownGraph(tax_breakdown_data, user_income, brackets)
-st.altair_chart(chart.get_full_combochart(), theme=None, use_container_width=True)
-
-st.write(f"Here's a tabular breakdown.")
-st.markdown(f"""If you earn **{convert_to_currency(user_income)}** in 
-            **{fiscal_year}** as a **{filer_type}** while living in 
-            **{country}**...""")
-tax_breakdown_data_display = tax_breakdown_data
-total_owed = convert_to_currency(tax_breakdown_data['bracket_owed'].sum())
-
-tax_breakdown_data_display['bracket_low'] = tax_breakdown_data_display['bracket_low'].apply(convert_to_currency)
-tax_breakdown_data_display['bracket_high'] = tax_breakdown_data_display['bracket_high'].apply(convert_to_currency)
-tax_breakdown_data_display['bracket_rate'] = tax_breakdown_data_display['bracket_rate'].apply(convert_to_percent)
-tax_breakdown_data_display['bracket_owed'] = tax_breakdown_data_display['bracket_owed'].apply(convert_to_currency)
-mapper = {
-    "bracket_low": "From...",
-    "bracket_high": "... to",
-    "bracket_rate": "You pay...",
-    "bracket_owed": "...which is"
-}
-tax_breakdown_data_display = tax_breakdown_data_display.rename(mapper, axis='columns')
-tax_breakdown_data_display = tax_breakdown_data_display.drop(["cum_owed_low", "cum_owed_high", "color"], axis='columns')
-st.dataframe(tax_breakdown_data_display, hide_index=True, use_container_width=True)
-st.markdown(f"Which amounts to a total federal tax obligation of **{total_owed}**.")
-
-with st.columns((2,1,2))[1]:
-    base_url = get_base_url()
-    param_url = get_param_url(country, fiscal_year, filer_type, user_income)
-    st_copy_to_clipboard(base_url+param_url, 
-                         before_copy_label="Share this result 📋",
-                         after_copy_label="Copied your result! ✅")
+render_explainer()
+render_calculator(tree, db)
+# After the first page is out, so warming never holds up a visitor
+warm_share_result_cache(LOCAL_DEVELOPMENT)
+if instrumentation.ENABLED:
+    render_debug_panel()
 
 st.markdown(f"This is only part of the tax calculation. You may owe additional taxes, such as state or social security.")
 st.markdown(f"""You may also be eligible for deductions. A typical deduction will reduce the taxable income you have from the top. 
@@ -0,0 +1,353 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import urllib.parse
+import numpy as np
+import bracket_store
+import calculate_tax_data
+
+# Headless JSON API over the calculator, for other services. Plain asyncio
+# HTTP/1.1 with keep-alive, no framework. Every endpoint takes a batch of
+# (year, filer, income) items, and the breakdown rows of all requests that
+# arrive in the same event loop turn are grouped by schedule and evaluated in
+# one calculate_tax_batch call per schedule.
+#
+#   GET  /tree                     {country: {year: [filer, ...]}}
+#   GET  /years?country=           {"years": [...]}, most recent first
+#   GET  /filers?country=&year=    {"filers": [...]}
+#   POST /breakdown                {"items": [{"year", "filer", "income"}, ...]}
+#   POST /cumulative               {"items": [{"year", "filer", "income", "interp"}, ...]}
+#
+# Items may also name a "country", the app's default otherwise. Schedules
+# are read from the packed store, which is memory mapped, so with several
+# workers every process shares the same pages.
+HOST = "127.0.0.1"
+PORT = 8080
+DEFAULT_COUNTRY = "United States"
+MAX_ITEMS = 10_000
+MAX_INTERP = 100
+MAX_BODY_BYTES = 4 * 1024 * 1024
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed", 413: "Payload Too Large",
+               500: "Internal Server Error"}
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def json_list(array):
+    # JSON has no infinity, the open top bracket's bound is sent as null
+    values = array.tolist()
+    if len(array) and not np.isfinite(array).all():
+        values = [value if np.isfinite(value) else None for value in values]
+    return values
+
+
+class ScheduleBatcher:
+    # Incomes submitted while the loop is busy are held until it comes
+    # around, then every schedule is evaluated once for all of them
+    def __init__(self):
+        self.pending = {}
+        self.flush_scheduled = False
+        self.batches = 0
+        self.rows = 0
+
+    def submit(self, schedule, incomes):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.setdefault(schedule, []).append((incomes, future))
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            loop.call_soon(self.flush)
+        return future
+
+    def flush(self):
+        pending, self.pending = self.pending, {}
+        self.flush_scheduled = False
+        for schedule, waiting in pending.items():
+            incomes = np.concatenate([incomes for incomes, _ in waiting])
+            try:
+                batch = calculate_tax_data.calculate_tax_batch(incomes, schedule)
+            except Exception as error:
+                for _, future in waiting:
+                    future.set_exception(error)
+                continue
+            self.batches += 1
+            self.rows += len(incomes)
+            start = 0
+            for part, future in waiting:
+                if not future.cancelled():
+                    future.set_result((batch, start))
+                start += len(part)
+
+
+class TaxAPI:
+    def __init__(self, store: bracket_store.PackedBracketStore):
+        self.store = store
+        self.tree = store.tree()
+        self.batcher = ScheduleBatcher()
+        self.routes = {
+            ("GET", "/tree"): self.get_tree,
+            ("GET", "/years"): self.get_years,
+            ("GET", "/filers"): self.get_filers,
+            ("POST", "/breakdown"): self.post_breakdown,
+            ("POST", "/cumulative"): self.post_cumulative,
+        }
+
+    async def dispatch(self, method, target, body):
+        path, _, query = target.partition("?")
+        route = self.routes.get((method, path))
+        if route is None:
+            if any(route_path == path for _, route_path in self.routes):
+                raise RequestError(405, f"{method} is not supported on {path}")
+            raise RequestError(404, f"No endpoint at {path}")
+        if method == "GET":
+            return route(dict(urllib.parse.parse_qsl(query)))
+        return await route(self.parse_items(body))
+
+    def parse_items(self, body):
+        try:
+            items = json.loads(body)["items"]
+        except (ValueError, KeyError, TypeError):
+            raise RequestError(400, 'Expected a JSON object with an "items" list')
+        if not isinstance(items, list):
+            raise RequestError(400, '"items" must be a list')
+        if len(items) > MAX_ITEMS:
+            raise RequestError(413, f"At most {MAX_ITEMS} items per request")
+        return items
+
+    def get_subtree(self, *path):
+        tree = self.tree
+        for name in path:
+            if name not in tree:
+                raise RequestError(404, f"No data for {' '.join(path)}")
+            tree = tree[name]
+        return tree
+
+    def get_tree(self, query):
+        return {country: {year: bracket_store.get_filer_options(filers)
+                          for year, filers in reversed(years.items())}
+                for country, years in self.tree.items()}
+
+    def get_years(self, query):
+        country = query.get("country", DEFAULT_COUNTRY)
+        return {"years": bracket_store.get_year_options(self.get_subtree(country))}
+
+    def get_filers(self, query):
+        country = query.get("country", DEFAULT_COUNTRY)
+        year = query.get("year", "")
+        return {"filers": bracket_store.get_filer_options(self.get_subtree(country, year))}
+
+    def resolve(self, item):
+        # (schedule, income) of one item, ValueError when it is not usable
+        if not isinstance(item, dict):
+            raise ValueError("Each item must be an object")
+        try:
+            income = float(item["income"])
+            year = str(item["year"])
+            filer = str(item["filer"])
+        except KeyError as error:
+            raise ValueError(f"Missing {error.args[0]}")
+        except (TypeError, ValueError):
+            raise ValueError("Income must be a number")
+        if not np.isfinite(income):
+            raise ValueError("Income must be finite")
+        country = str(item.get("country", DEFAULT_COUNTRY))
+        return self.store.get(country, year, filer), income
+
+    async def post_breakdown(self, items):
+        results = [None] * len(items)
+        groups = {}
+        for i, item in enumerate(items):
+            try:
+                schedule, income = self.resolve(item)
+            except ValueError as error:
+                results[i] = {"error": str(error)}
+                continue
+            positions, incomes = groups.setdefault(schedule, ([], []))
+            positions.append(i)
+            incomes.append(income)
+        futures = [(positions, self.batcher.submit(schedule, np.array(incomes)))
+                   for schedule, (positions, incomes) in groups.items()]
+        for positions, future in futures:
+            batch, start = await future
+            for row, i in enumerate(positions, start):
+                results[i] = format_breakdown(batch, row)
+        return {"results": results}
+
+    async def post_cumulative(self, items):
+        results = []
+        for item in items:
+            try:
+                schedule, income = self.resolve(item)
+                interp = get_interp(item)
+            except ValueError as error:
+                results.append({"error": str(error)})
+                continue
+            cumulative = calculate_tax_data.calculate_cumulative_tax(
+                income, schedule, interp=interp, adaptive=bool(item.get("adaptive", False)),
+                as_arrays=True)
+            results.append({name: json_list(values) for name, values in cumulative.items()})
+        return {"results": results}
+
+
+def get_interp(item):
+    try:
+        interp = int(item.get("interp", 3))
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("interp must be an integer")
+    if not 1 <= interp <= MAX_INTERP:
+        raise ValueError(f"interp must be between 1 and {MAX_INTERP}")
+    return interp
+
+
+def format_breakdown(batch, row):
+    # The columns of calculate_tax_breakdown_data for one income, as lists
+    income = batch["income"][row]
+    reached = batch["bracket_low"] < income
+    bracket_owed = batch["bracket_owed"][row][reached]
+    cum_owed_low = batch["cum_owed_low"][reached]
+    return {
+        "income": float(income),
+        "owed": float(batch["owed"][row]),
+        "effective_rate": float(batch["effective_rate"][row]),
+        "marginal_rate": float(batch["marginal_rate"][row]),
+        "brackets": {
+            "bracket_low": json_list(batch["bracket_low"][reached]),
+            "bracket_high": json_list(batch["bracket_high"][reached]),
+            "bracket_rate": json_list(batch["bracket_rate"][reached]),
+            "bracket_owed": json_list(bracket_owed),
+            "cum_owed_low": json_list(cum_owed_low),
+            "cum_owed_high": json_list(cum_owed_low + bracket_owed),
+        },
+    }
+
+
+def encode_response(status, payload, keep_alive):
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    head = (f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+
+async def read_request(reader):
+    # (method, target, headers, body), None once the client has gone
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, target, version = request_line.decode("latin-1").split()
+    except ValueError:
+        raise RequestError(400, "Malformed request line")
+    headers = {"version": version}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise RequestError(400, "Malformed Content-Length")
+    if length < 0:
+        raise RequestError(400, "Malformed Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise RequestError(413, f"Bodies are limited to {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method, target, headers, body
+
+
+async def handle_connection(api: TaxAPI, reader, writer):
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except RequestError as error:
+                writer.write(encode_response(error.status, {"error": str(error)}, False))
+                break
+            if request is None:
+                break
+            method, target, headers, body = request
+            keep_alive = (headers["version"] == "HTTP/1.1" and
+                          headers.get("connection", "").lower() != "close")
+            try:
+                status, payload = 200, await api.dispatch(method, target, body)
+            except RequestError as error:
+                status, payload = error.status, {"error": str(error)}
+            except Exception as error:
+                status, payload = 500, {"error": f"{type(error).__name__}: {error}"}
+            writer.write(encode_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host, port, packed_path, reuse_port=False):
+    store = bracket_store.load_packed_store(packed_path)
+    api = TaxAPI(store)
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(api, reader, writer),
+        host, port, reuse_port=reuse_port, backlog=1024)
+    async with server:
+        await server.serve_forever()
+
+
+def run_worker(host, port, packed_path, reuse_port):
+    try:
+        asyncio.run(serve(host, port, packed_path, reuse_port))
+    except KeyboardInterrupt:
+        pass
+
+
+def stop_service(signal_number, frame):
+    raise SystemExit(0)
+
+
+def run_service(host=HOST, port=PORT, workers=1, packed_path=bracket_store.PACKED_STORE_PATH):
+    # Workers share the port through SO_REUSEPORT, the kernel spreads
+    # connections across them
+    if bracket_store.load_packed_store(packed_path) is None:
+        bracket_store.build_packed_store(output_path=packed_path)
+    if workers <= 1:
+        run_worker(host, port, packed_path, False)
+        return
+    processes = [multiprocessing.Process(target=run_worker,
+                                         args=(host, port, packed_path, True))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    # SIGTERM only reaches this process, unwind so the workers are stopped too
+    signal.signal(signal.SIGTERM, stop_service)
+    try:
+        for process in processes:
+            process.join()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve tax calculations as a JSON API")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--packed-store", default=bracket_store.PACKED_STORE_PATH)
+    args = parser.parse_args()
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers", flush=True)
+    run_service(args.host, args.port, args.workers, args.packed_store)
@@ -0,0 +1,122 @@
+import functools
+import numpy as np
+from bracket_schedule import BracketSchedule
+
+# Exact tax in integer cents, alongside the float path in calculate_tax_data.
+# Bounds are held as int64 cents and rates as int64 basis points, so tax
+# inside a bracket is width * rate exactly in units of 1/10,000 of a cent.
+# Those are summed without any loss and rounded to cents once, at the end,
+# with a vectorized rounding rule. Totals then match a Decimal calculation
+# to the cent however many brackets or incomes there are.
+RATE_SCALE = 10_000
+ROUNDING = ("half_up", "half_even", "down", "up")
+# The open top bracket's bound, past any income that can be taxed exactly
+OPEN_BOUND = np.iinfo(np.int64).max
+
+
+def dollars_to_cents(dollars):
+    return np.rint(np.asarray(dollars, dtype=float) * 100).astype(np.int64)
+
+
+def round_scaled(amounts, scale, rounding="half_up"):
+    # Integer amounts in units of 1/scale down to whole units. Amounts are
+    # never negative here, so half_up rounds halves away from zero. All but
+    # half_even come down to a single floor division
+    if rounding == "half_up":
+        return (amounts + scale // 2) // scale
+    if rounding == "half_even":
+        quotient, remainder = np.divmod(amounts, scale)
+        return quotient + ((2 * remainder > scale) |
+                           ((2 * remainder == scale) & (quotient % 2 == 1)))
+    if rounding == "down":
+        return amounts // scale
+    if rounding == "up":
+        return (amounts + scale - 1) // scale
+    raise ValueError(f"Rounding must be one of {', '.join(ROUNDING)}")
+
+
+class CentsSchedule:
+    # Integer form of a BracketSchedule, built once per schedule
+    def __init__(self, schedule: BracketSchedule):
+        bounds = schedule.finite_bounds()
+        rates = schedule.bracket_rate * RATE_SCALE
+        if not np.allclose(np.round(bounds * 100), bounds * 100, rtol=0, atol=1e-6):
+            raise ValueError("Bracket bounds must be whole cents")
+        # Rates are snapped to whole basis points, the source data carries
+        # float noise such as 0.22399999999999998 for 22.4%
+        if not np.allclose(np.round(rates), rates, rtol=0, atol=1e-6):
+            raise ValueError("Bracket rates must be whole basis points")
+        self.bracket_high = np.append(np.round(bounds * 100).astype(np.int64), OPEN_BOUND)
+        self.bracket_low = np.concatenate(([0], self.bracket_high[:-1]))
+        self.bracket_rate = np.round(rates).astype(np.int64)
+        # Owed on every full bracket below each lower bound, in 1/RATE_SCALE cents
+        full_bracket_owed = (self.bracket_high[:-1] - self.bracket_low[:-1]) * self.bracket_rate[:-1]
+        self.cum_owed_low = np.concatenate(([0], np.cumsum(full_bracket_owed)))
+        # Owed in a bracket is intercept + income * rate, one lookup less
+        self.intercept = self.cum_owed_low - self.bracket_low * self.bracket_rate
+        # Largest income in cents for which income * rate + intercept stays
+        # inside an int64 in every bracket
+        top_rate = max(int(self.bracket_rate.max()), 1)
+        self.max_income = (OPEN_BOUND - int(np.abs(self.intercept).max())) // top_rate
+
+
+@functools.lru_cache(maxsize=1024)
+def get_cents_schedule(schedule: BracketSchedule):
+    return CentsSchedule(schedule)
+
+
+def coerce_cents(incomes_cents):
+    incomes = np.asarray(incomes_cents)
+    if incomes.dtype.kind not in "iu":
+        raise TypeError("Incomes must be integer cents, see dollars_to_cents")
+    return np.maximum(incomes.astype(np.int64, copy=False), 0)
+
+
+def evaluate_cents(cents: CentsSchedule, incomes):
+    # (owed in 1/RATE_SCALE cents, bracket index) of each income in cents
+    if len(incomes) and incomes.max() > cents.max_income:
+        raise OverflowError(f"Incomes above {cents.max_income} cents can't be taxed exactly")
+    # OPEN_BOUND is past every income, so the index never runs off the end
+    index = np.searchsorted(cents.bracket_high, incomes, side="right")
+    owed = cents.intercept[index] + incomes * cents.bracket_rate[index]
+    return owed, index
+
+
+def calculate_tax_owed_cents(incomes_cents, brackets, rounding="half_up"):
+    # Owed in cents on each income in cents, exact up to the one final rounding
+    cents = get_cents_schedule(BracketSchedule.coerce(brackets))
+    owed, _ = evaluate_cents(cents, coerce_cents(incomes_cents))
+    return round_scaled(owed, RATE_SCALE, rounding)
+
+
+def calculate_tax_batch_cents(incomes_cents, brackets, rounding="half_up"):
+    # The summary columns of calculate_tax_data.calculate_tax_batch, with
+    # income and owed as int64 cents
+    schedule = BracketSchedule.coerce(brackets)
+    incomes = coerce_cents(incomes_cents)
+    owed, index = evaluate_cents(get_cents_schedule(schedule), incomes)
+    owed = round_scaled(owed, RATE_SCALE, rounding)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        effective_rate = np.where(incomes > 0, owed / incomes, 0.0)
+    return {
+        "income": incomes,
+        "owed": owed,
+        "effective_rate": effective_rate,
+        "marginal_rate": schedule.bracket_rate[index],
+    }
+
+
+def calculate_cumulative_tax_cents(income_cents, brackets, rounding="half_up"):
+    # Owed in cents at the top of every bracket the income reaches, the last
+    # one stopping at the income, the exact counterpart of the breakpoints
+    # calculate_cumulative_tax draws
+    schedule = BracketSchedule.coerce(brackets)
+    cents = get_cents_schedule(schedule)
+    income = int(income_cents)
+    reached = cents.bracket_low < income
+    points = np.minimum(cents.bracket_high[reached], income)
+    return {
+        "income": points,
+        "owed": calculate_tax_owed_cents(points, schedule, rounding),
+        "bracket_rate": schedule.bracket_rate[reached],
+    }
@@ -0,0 +1,55 @@
+import math
+import os
+import pytest
+import batch_calculator
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def write_input(tmp_path):
+    input_path = str(tmp_path / "incomes.csv")
+    with open(input_path, "w") as file:
+        file.write("income,year,filer\n"
+                   "1000,2021,Single Filer\n"
+                   "abc,2021,Single Filer\n"
+                   ",2021,Single Filer\n")
+    return input_path
+
+
+def read_output(output_path, output_format):
+    if output_format == "parquet":
+        return pq.read_table(output_path)
+    with open(output_path, "rb") as file:
+        return pa.ipc.open_stream(file).read_all()
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "arrow"])
+def test_bad_income_in_a_later_chunk_is_written_blank(tmp_path, output_format):
+    output_path = str(tmp_path / f"out.{output_format}")
+    records, unmatched, invalid = batch_calculator.run_batch(
+        write_input(tmp_path), output_path, chunk_size=1)
+    assert (records, unmatched, invalid) == (3, 0, 2)
+    table = read_output(output_path, output_format).to_pydict()
+    assert table["income"][0] == 1000
+    assert table["owed"][0] == 100
+    for column in ("income", "owed", "effective_rate", "marginal_rate"):
+        assert all(value is None or math.isnan(value) for value in table[column][1:])
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "arrow"])
+def test_failed_run_leaves_no_output_file(tmp_path, monkeypatch, output_format):
+    calculate_chunk = batch_calculator.calculate_chunk
+    calls = []
+
+    def fail_on_second_chunk(chunk, schedules):
+        calls.append(chunk)
+        if len(calls) == 2:
+            raise RuntimeError("failed")
+        return calculate_chunk(chunk, schedules)
+
+    monkeypatch.setattr(batch_calculator, "calculate_chunk", fail_on_second_chunk)
+    output_path = str(tmp_path / f"out.{output_format}")
+    with pytest.raises(RuntimeError, match="failed"):
+        batch_calculator.run_batch(write_input(tmp_path), output_path, chunk_size=1)
+    assert not os.path.exists(output_path)
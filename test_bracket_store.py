@@ -0,0 +1,61 @@
+import json
+import os
+import shutil
+import pytest
+import bracket_store
+
+
+def make_source(tmp_path):
+    source_path = str(tmp_path / "source")
+    year_path = os.path.join(source_path, "United States", "2025")
+    shutil.copytree(os.path.join(bracket_store.SOURCE_PATH, "United States", "2025"), year_path)
+    return source_path
+
+
+def edit_top_rate(source_path, rate):
+    file_path = os.path.join(source_path, "United States", "2025", "Single Filer.json")
+    with open(file_path) as file:
+        brackets = json.load(file)
+    brackets["inf"] = rate
+    with open(file_path, "w") as file:
+        json.dump(brackets, file)
+    # Make the edit visible even on filesystems with coarse timestamps
+    stat = os.stat(file_path)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_packed_store_is_used_while_it_matches_its_source(tmp_path):
+    source_path = make_source(tmp_path)
+    packed_path = bracket_store.build_packed_store(source_path, str(tmp_path / "store.bin"))
+    assert bracket_store.load_packed_store(packed_path, source_path) is not None
+
+
+def test_edited_source_is_never_shadowed_by_the_packed_store(tmp_path):
+    source_path = make_source(tmp_path)
+    packed_path = bracket_store.build_packed_store(source_path, str(tmp_path / "store.bin"))
+    edit_top_rate(source_path, 0.40)
+    with pytest.warns(UserWarning, match="does not match"):
+        assert bracket_store.load_packed_store(packed_path, source_path) is None
+    with pytest.warns(UserWarning):
+        schedule = bracket_store.load_schedule("United States", "2025", "Single Filer",
+                                               source_path, packed_path)
+    assert schedule.bracket_rate[-1] == 0.40
+    with pytest.warns(UserWarning):
+        schedules = bracket_store.load_schedules(source_path, packed_path)
+    assert schedules[("United States", "2025", "Single Filer")].bracket_rate[-1] == 0.40
+    # A rebuilt store is used again and carries the edit
+    bracket_store.build_packed_store(source_path, packed_path)
+    store = bracket_store.load_packed_store(packed_path, source_path)
+    assert store.get("United States", "2025", "Single Filer").bracket_rate[-1] == 0.40
+
+
+def test_packed_store_is_used_without_a_source_tree(tmp_path):
+    source_path = make_source(tmp_path)
+    packed_path = bracket_store.build_packed_store(source_path, str(tmp_path / "store.bin"))
+    shutil.rmtree(source_path)
+    assert bracket_store.load_packed_store(packed_path, source_path) is not None
+
+
+def test_sort_years_keeps_variants_next_to_their_year():
+    years = bracket_store.sort_years(["2025", "1940(A)", "1862", "1940", "1941"])
+    assert years == ["1862", "1940", "1940(A)", "1941", "2025"]
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+import calculate_tax_data
+import create_graph
+from bracket_schedule import BracketSchedule
+
+
+def make_schedule(bracket_count):
+    bounds = [10_000.0 * (i + 1) for i in range(bracket_count - 1)] + [float("inf")]
+    rates = np.linspace(0.01, 0.9, bracket_count)
+    return BracketSchedule(bounds, rates)
+
+
+@pytest.mark.parametrize("bracket_count", [7, 11, 16, 20])
+def test_schedules_within_the_palette_draw_every_bracket(bracket_count):
+    assert list(create_graph.get_bracket_bands(bracket_count)) == list(range(bracket_count))
+    schedule = make_schedule(bracket_count)
+    income = 10_000.0 * bracket_count
+    data = calculate_tax_data.calculate_tax_breakdown_data(income, schedule)
+    graph = create_graph.TaxBracketBreakdownGraph(data, income, schedule)
+    assert len(set(graph.get_chart_data()["band"])) == bracket_count
+
+
+@pytest.mark.parametrize("bracket_count", [21, 26, 56])
+def test_denser_schedules_are_banded(bracket_count):
+    bands = create_graph.get_bracket_bands(bracket_count)
+    assert len(set(bands)) == create_graph.MAX_BANDS
+    assert (np.diff(bands) >= 0).all()
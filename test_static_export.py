@@ -0,0 +1,50 @@
+import json
+import os
+import shutil
+import bracket_store
+import static_export
+
+
+def make_source(tmp_path):
+    source_path = str(tmp_path / "source")
+    year_path = os.path.join(source_path, "United States", "2025")
+    os.makedirs(year_path)
+    shutil.copy(os.path.join(bracket_store.SOURCE_PATH, "United States", "2025", "Single Filer.json"),
+                year_path)
+    return source_path
+
+
+def get_exported_rates(export_path):
+    # Every bracket rate in the exported step chart
+    with open(os.path.join(export_path, static_export.MANIFEST_NAME)) as file:
+        manifest = json.load(file)
+    digest = manifest["tree"]["United States"]["2025"]["Single Filer"]
+    with open(os.path.join(export_path, manifest["schedules"][digest]["bracket_step"])) as file:
+        spec = json.load(file)
+    return {row["bracket_rate"] for rows in spec["datasets"].values() for row in rows
+            if "bracket_rate" in row}
+
+
+def test_export_follows_edits_to_the_source_json(tmp_path):
+    source_path = make_source(tmp_path)
+    export_path = str(tmp_path / "export")
+    report = static_export.run_export(export_path, workers=1, reference_incomes=(65_000,),
+                                      source_path=source_path)
+    assert report["rebuilt"] == 1
+    assert 0.37 in get_exported_rates(export_path)
+
+    file_path = os.path.join(source_path, "United States", "2025", "Single Filer.json")
+    with open(file_path) as file:
+        brackets = json.load(file)
+    brackets["inf"] = 0.40
+    with open(file_path, "w") as file:
+        json.dump(brackets, file)
+    report = static_export.run_export(export_path, workers=1, reference_incomes=(65_000,),
+                                      source_path=source_path)
+    assert report["rebuilt"] == 1
+    rates = get_exported_rates(export_path)
+    assert 0.40 in rates and 0.37 not in rates
+
+    report = static_export.run_export(export_path, workers=1, reference_incomes=(65_000,),
+                                      source_path=source_path)
+    assert report["rebuilt"] == 0